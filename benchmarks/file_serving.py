@@ -0,0 +1,113 @@
+"""
+Throughput of RangeFileResponse against the naive way to serve a file, reading it whole and
+returning its bytes, on whole files and on a small range of a big one.
+
+    python -m benchmarks.file_serving
+    python -m benchmarks.file_serving --sizes 1 64 256 --requests 200 --concurrency 8
+
+The apps are called in-process as plain ASGI callables, without the pathsend extension, so
+RangeFileResponse sends slices of a memory map: the path it takes under servers without
+pathsend, and for every range request. A naive range is a slice of the whole file read.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from fastapi import FastAPI, Request, Response
+
+from core.responses import RangeFileResponse, parse_ranges
+
+
+MiB = 1024 * 1024
+
+
+def naive_app(root: Path) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/{name}")
+    def read(name: str, request: Request):
+        data = (root / name).read_bytes()
+        ranges = parse_ranges(request.headers["range"], len(data)) if "range" in request.headers else None
+        if ranges:
+            start, end = ranges[0]
+            return Response(data[start:end], status_code=206, media_type="application/octet-stream")
+        return Response(data, media_type="application/octet-stream")
+
+    return app
+
+
+def range_app(root: Path) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/{name}", response_class=RangeFileResponse)
+    async def read(name: str):
+        return RangeFileResponse(root / name)
+
+    return app
+
+
+def make_scope(path: str, headers: list[tuple[bytes, bytes]]) -> dict:
+    return {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"", "headers": headers,
+        "client": ("127.0.0.1", 12345), "server": ("127.0.0.1", 8000),
+    }
+
+
+async def call(app, path: str, headers: list[tuple[bytes, bytes]]) -> int:
+    received = 0
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal received
+        if message["type"] == "http.response.body":
+            received += len(message.get("body", b""))
+
+    await app(make_scope(path, headers), receive, send)
+    return received
+
+
+async def throughput(app, path: str, headers: list[tuple[bytes, bytes]], requests: int,
+                     concurrency: int) -> tuple[float, float]:
+    """Requests and MiB per second"""
+    async def client(count: int) -> int:
+        return sum([await call(app, path, headers) for _ in range(count)])
+
+    await client(2)     # Warm up, and the page cache too
+    start_time = time.perf_counter()
+    received = sum(await asyncio.gather(*[client(requests // concurrency) for _ in range(concurrency)]))
+    elapsed = time.perf_counter() - start_time
+    return requests // concurrency * concurrency / elapsed, received / MiB / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 16, 128], help="File sizes in MiB")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        root = Path(directory)
+        scenarios = {}
+        for size in args.sizes:
+            (root / f"{size}.bin").write_bytes(os.urandom(size * MiB))
+            scenarios[f"{size} MiB whole"] = (f"/{size}.bin", [])
+        biggest = max(args.sizes)
+        scenarios[f"64 KiB of {biggest} MiB"] = (f"/{biggest}.bin", [(b"range", f"bytes={MiB}-{MiB + 65535}".encode())])
+
+        print(f"{'scenario':<22}{'naive rps':>11}{'naive MiB/s':>13}{'range rps':>11}{'range MiB/s':>13}{'speedup':>9}")
+        for name, (path, headers) in scenarios.items():
+            naive_rps, naive_mib = asyncio.run(throughput(naive_app(root), path, headers, args.requests, args.concurrency))
+            range_rps, range_mib = asyncio.run(throughput(range_app(root), path, headers, args.requests, args.concurrency))
+            print(f"{name:<22}{naive_rps:>11.0f}{naive_mib:>13.0f}{range_rps:>11.0f}{range_mib:>13.0f}"
+                  f"{range_rps / naive_rps:>8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
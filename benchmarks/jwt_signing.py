@@ -0,0 +1,65 @@
+"""
+Sign and verify throughput of access tokens with each JWT algorithm the app supports.
+
+    python -m benchmarks.jwt_signing
+    python -m benchmarks.jwt_signing --tokens 5000 --algorithms EdDSA RS256
+
+RS256 and EdDSA go through KeySet.encode and KeySet.decode, on a key set in a temporary
+directory. HS256 has no key set: like core.security.encode_token/decode_token, it calls PyJWT
+with a shared secret. The payloads are the ones create_access_token makes. Best of --repeat runs.
+"""
+import argparse
+import secrets
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Callable
+
+import jwt
+
+from core.jwt_keys import ASYMMETRIC_ALGORITHMS, KeySet
+
+
+def codec(algorithm: str, key_dir: str) -> tuple[Callable[[dict], str], Callable[[str], dict]]:
+    if algorithm in ASYMMETRIC_ALGORITHMS:
+        key_set = KeySet(algorithm, key_dir, rotation_interval=3600, overlap=60)
+        return key_set.encode, key_set.decode
+    secret = secrets.token_hex(32)
+    return (
+        lambda payload: jwt.encode(payload, secret, algorithm=algorithm),
+        lambda token: jwt.decode(token, secret, algorithms=[algorithm]),
+    )
+
+
+def best_rate(func: Callable, inputs: list, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        for value in inputs:
+            func(value)
+        best = min(best, time.perf_counter() - start_time)
+    return len(inputs) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=2000, help="Tokens signed and verified per run")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per algorithm and operation, the best one counts")
+    parser.add_argument("--algorithms", nargs="+", default=["HS256", "RS256", "EdDSA"])
+    args = parser.parse_args()
+
+    expire = datetime.now(timezone.utc) + timedelta(minutes=30)
+    payloads = [{"sub": f"user{number}", "exp": expire, "jti": uuid.uuid4().hex} for number in range(args.tokens)]
+    print(f"{'algorithm':<11}{'sign/s':>10}{'verify/s':>10}{'token bytes':>13}")
+    for algorithm in args.algorithms:
+        with tempfile.TemporaryDirectory(prefix="bench-jwt-") as key_dir:
+            encode, decode = codec(algorithm, key_dir)
+            tokens = [encode(payload) for payload in payloads]    # Also creates the key
+            sign_rate = best_rate(encode, payloads, args.repeat)
+            verify_rate = best_rate(decode, tokens, args.repeat)
+        print(f"{algorithm:<11}{sign_rate:>10.0f}{verify_rate:>10.0f}{len(tokens[0]):>13}")
+
+
+if __name__ == "__main__":
+    main()
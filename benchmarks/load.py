@@ -0,0 +1,391 @@
+"""
+Throughput, latency percentiles and peak RSS of each router under fixed load profiles, saved as
+JSON and compared to a baseline to catch regressions.
+
+    python -m benchmarks.load
+    python -m benchmarks.load --server
+    python -m benchmarks.load --scenarios heroes offers --requests 5000 --concurrency 64
+    python -m benchmarks.load --output benchmarks/baseline.json
+    python -m benchmarks.load --baseline benchmarks/baseline.json --output results.json
+
+By default the app is called in-process through httpx's ASGI transport, so the numbers are the
+cost of the app alone. With --server it runs in a uvicorn subprocess and the requests go through
+a socket, from a client in this process that may become the bottleneck first.
+
+Each scenario gets a fresh process and work directory (database, upload store, JWT keys, see
+benchmarks/server.py), so its peak RSS is its own; in-process, it includes the client. The heroes
+ones seed --heroes heroes through POST /heroes/bulk first. The requests are drawn beforehand
+from a random generator seeded with --seed, so runs with the same profile send the same ones.
+
+A scenario regresses when its throughput drops, or its p95 latency or peak RSS grows, by more
+than --tolerance from the baseline, or when it gets more errors: the exit status is then 1.
+"""
+import argparse
+import asyncio
+import json
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from multiprocessing import get_context
+from pathlib import Path
+from statistics import quantiles
+from typing import Any, Callable
+
+import httpx
+
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+@dataclass(frozen=True)
+class LoadProfile:
+    requests: int = 2000
+    concurrency: int = 32
+    warmup: int = 100
+    heroes: int = 1000
+    upload_size: int = 64 * 1024
+    seed: int = 0
+
+
+@dataclass(frozen=True)
+class Request:
+    method: str
+    url: str
+    # httpx keyword arguments, or a function making them when the request is sent (for big bodies)
+    kwargs: dict[str, Any] | Callable[[], dict[str, Any]] = field(default_factory=dict)
+    expected: int = 200
+
+
+@dataclass(frozen=True)
+class Scenario:
+    plan: Callable[[LoadProfile, random.Random, int], list[Request]]
+    max_requests: int | None = None     # For the slow ones, e.g. a login is a password hash
+    seed_heroes: bool = False
+
+
+def random_hero(rng: random.Random) -> dict:
+    number = rng.randrange(10 ** 6)
+    return {"name": f"Hero {number}", "age": rng.randint(18, 90), "secret_name": f"Secret {number}"}
+
+
+def heroes_plan(prefix: str) -> Callable[[LoadProfile, random.Random, int], list[Request]]:
+    def plan(profile: LoadProfile, rng: random.Random, count: int) -> list[Request]:
+        # Reads hit the bottom half of the seeded heroes, deletes take the top half from its end
+        readable = max(1, profile.heroes // 2)
+        deletable = list(range(readable + 1, profile.heroes + 1))
+        requests = []
+        for _ in range(count):
+            roll = rng.random()
+            if roll < 0.05 and deletable:
+                requests.append(Request("DELETE", f"{prefix}/heroes/{deletable.pop()}"))
+            elif roll < 0.20:
+                requests.append(Request("POST", f"{prefix}/heroes/", {"json": random_hero(rng)}))
+            elif roll < 0.30:
+                params = {"offset": rng.randrange(readable), "limit": 50}
+                requests.append(Request("GET", f"{prefix}/heroes/", {"params": params}))
+            else:
+                requests.append(Request("GET", f"{prefix}/heroes/{rng.randint(1, readable)}"))
+        return requests
+    return plan
+
+
+def token_plan(profile: LoadProfile, rng: random.Random, count: int) -> list[Request]:
+    return [Request("POST", "/token", {"data": {"username": "johndoe", "password": "secret"}})] * count
+
+
+def items_plan(profile: LoadProfile, rng: random.Random, count: int) -> list[Request]:
+    # Bodies that pass validation, so the handlers run and answer 200
+    requests = []
+    for _ in range(count):
+        if rng.random() < 0.5:
+            requests.append(Request("PUT", f"/items/{uuid.UUID(int=rng.getrandbits(128))}", {"json": {
+                "user": {"username": "johndoe", "full_name": "John Doe", "email": "johndoe@example.com"},
+                "importance": rng.randint(1, 5),
+                "item": {"name": "Foo", "description": "A very nice Item", "price": round(rng.uniform(1, 100), 2),
+                         "tax": 3.2, "tags": ["a", "b"]},
+                "start_datetime": "2024-01-01T10:00:00.123Z",
+                "end_datetime": "2024-01-02T10:00:00+02:00",
+                "process_after": rng.randint(60, 7200),
+                "repeat_at": "13:00:00",
+            }}))
+        else:
+            item_id = rng.choice(("foo", "bar", "baz"))
+            requests.append(Request("PATCH", f"/items/{item_id}", {"json": {
+                "name": item_id.capitalize(),
+                "price": round(rng.uniform(1, 100), 2),
+                "tags": ["a", "b"],
+                "images": [{"url": f"https://example.com/{item_id}/{number}.png", "name": f"Image {number}"}
+                           for number in range(rng.randint(1, 5))],
+            }}))
+    return requests
+
+
+def items_rejected_plan(profile: LoadProfile, rng: random.Random, count: int) -> list[Request]:
+    # find_item_by_item_id: path, query, cookies and headers models. Its headers model forbids
+    # the Cookie header its cookies model needs, so it always answers 422: the rejection path
+    return [
+        Request(
+            "GET",
+            f"/items/{rng.randint(1, 1000)}",
+            {
+                "params": {"q": f"query {rng.randrange(100)}", "size": round(rng.uniform(0.1, 10.4), 2)},
+                "headers": {"save-data": rng.choice(("true", "false")), "x-tag": "a",
+                            "cookie": f"session_id={rng.randrange(10 ** 6)}"},
+            },
+            expected=422,
+        )
+        for _ in range(count)
+    ]
+
+
+def uploads_plan(profile: LoadProfile, rng: random.Random, count: int) -> list[Request]:
+    # Files differ by their first 8 bytes; one in ten repeats an earlier one, and is deduplicated
+    blob = rng.randbytes(max(0, profile.upload_size - 8))
+
+    def upload(number: int) -> Callable[[], dict[str, Any]]:
+        return lambda: {"files": {"file": (f"file{number}.bin", number.to_bytes(8, "big") + blob)}}
+
+    return [
+        Request("POST", "/uploadfile/", upload(rng.randrange(index + 1) if rng.random() < 0.1 else index))
+        for index in range(count)
+    ]
+
+
+def offers_plan(profile: LoadProfile, rng: random.Random, count: int) -> list[Request]:
+    def item(number: int) -> dict:
+        return {
+            "name": f"Item {number}",
+            "price": round(rng.uniform(1, 100), 2),
+            "tax": 1.5,
+            "images": [{"url": f"https://example.com/{number}/{image}.png", "name": f"{image}"} for image in range(2)],
+            "tags": ["a", "b", "c"],
+        }
+
+    return [
+        Request("POST", "/offers/", {"json": {
+            "name": f"Offer {index}",
+            "description": "A nested offer",
+            "total_price": round(rng.uniform(10, 1000), 2),
+            "items": [item(number) for number in range(10)],
+        }})
+        for index in range(count)
+    ]
+
+
+SCENARIOS = {
+    "heroes": Scenario(heroes_plan(""), seed_heroes=True),
+    "heroes-async": Scenario(heroes_plan("/async"), seed_heroes=True),
+    "token": Scenario(token_plan, max_requests=500),
+    "items": Scenario(items_plan),
+    "items-rejected": Scenario(items_rejected_plan),
+    "uploads": Scenario(uploads_plan),
+    "offers": Scenario(offers_plan),
+}
+
+
+async def send_all(client: httpx.AsyncClient, requests: list[Request], concurrency: int,
+                   latencies: list[float] | None = None) -> int:
+    """Send the requests from concurrency clients and return the number of unexpected answers"""
+    errors = 0
+    pending = iter(requests)    # Shared: each client takes the next request
+
+    async def worker():
+        nonlocal errors
+        for request in pending:
+            kwargs = request.kwargs() if callable(request.kwargs) else request.kwargs
+            start_time = time.perf_counter()
+            try:
+                response = await client.request(request.method, request.url, **kwargs)
+                failed = response.status_code != request.expected
+            except httpx.HTTPError:
+                failed = True
+            if latencies is not None:
+                latencies.append(time.perf_counter() - start_time)
+            errors += failed
+
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return errors
+
+
+async def measure(client: httpx.AsyncClient, name: str, profile: LoadProfile) -> dict:
+    # Only the headers of each request: find_item_by_item_id rejects any other one
+    for header in list(client.headers):
+        del client.headers[header]
+    scenario = SCENARIOS[name]
+    if scenario.seed_heroes:
+        rng = random.Random(profile.seed)
+        response = await client.post("/heroes/bulk", json=[random_hero(rng) for _ in range(profile.heroes)])
+        response.raise_for_status()
+
+    count = min(profile.requests, scenario.max_requests or profile.requests)
+    requests = scenario.plan(profile, random.Random(profile.seed), profile.warmup + count)
+    await send_all(client, requests[:profile.warmup], profile.concurrency)
+    latencies = []
+    start_time = time.perf_counter()
+    errors = await send_all(client, requests[profile.warmup:], profile.concurrency, latencies)
+    seconds = time.perf_counter() - start_time
+    percentiles = quantiles(latencies, n=100, method="inclusive")
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "seconds": seconds,
+        "throughput": len(latencies) / seconds,
+        "p50_ms": percentiles[49] * 1000,
+        "p95_ms": percentiles[94] * 1000,
+        "p99_ms": percentiles[98] * 1000,
+    }
+
+
+def peak_rss_mb(pid: int | None = None) -> float | None:
+    """Peak RSS of the process (this one by default), None where it can't be read"""
+    if pid is None:
+        try:
+            import resource
+        except ImportError:     # Windows
+            return None
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10   # Bytes on macOS, KiB elsewhere
+    try:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 2 ** 10
+    except OSError:     # Not Linux
+        pass
+    return None
+
+
+def run_in_process(name: str, profile: LoadProfile, workdir: str) -> dict:
+    from benchmarks.server import configure
+    configure(workdir)
+    from main import app
+
+    async def run() -> dict:
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+                return await measure(client, name, profile)
+
+    return {**asyncio.run(run()), "peak_rss_mb": peak_rss_mb()}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(base_url: str, process: subprocess.Popen, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"The server exited with status {process.returncode}")
+        try:
+            httpx.get(base_url + "/").raise_for_status()
+            return
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    raise RuntimeError(f"The server didn't answer within {timeout} s")
+
+
+def run_on_server(name: str, profile: LoadProfile, workdir: str) -> dict:
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.server", "--workdir", workdir, "--port", str(port)], cwd=ROOT
+    )
+    try:
+        base_url = f"http://127.0.0.1:{port}"
+        wait_until_up(base_url, process)
+        limits = httpx.Limits(max_connections=profile.concurrency, max_keepalive_connections=profile.concurrency)
+
+        async def run() -> dict:
+            async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+                return await measure(client, name, profile)
+
+        return {**asyncio.run(run()), "peak_rss_mb": peak_rss_mb(process.pid)}
+    finally:
+        process.terminate()
+        process.wait(10)
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Print the changes from the baseline and return the regressions"""
+    if baseline.get("mode") != results["mode"] or baseline.get("profile") != results["profile"]:
+        print("\nThe baseline was run in another mode or with another profile, the comparison may not mean much")
+    print(f"\n{'scenario':<14}{'metric':<13}{'baseline':>10}{'now':>10}{'change':>9}")
+    regressions = []
+    for name, result in results["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if before is None:
+            continue
+        if result["errors"] > before.get("errors", 0):
+            regressions.append(f"{name}: {result['errors']} errors, {before.get('errors', 0)} in the baseline")
+        # Throughput is better higher, latency and memory lower
+        for metric, sign in (("throughput", -1), ("p95_ms", 1), ("peak_rss_mb", 1)):
+            old, new = before.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            print(f"{name:<14}{metric:<13}{old:>10.1f}{new:>10.1f}{change:>+9.1%}")
+            if change * sign > tolerance:
+                regressions.append(f"{name}: {metric} {old:.1f} -> {new:.1f} ({change:+.1%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--server", action="store_true", help="Run the app in a uvicorn subprocess")
+    parser.add_argument("--requests", type=int, default=LoadProfile.requests, help="Timed requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=LoadProfile.concurrency)
+    parser.add_argument("--warmup", type=int, default=LoadProfile.warmup, help="Untimed requests first")
+    parser.add_argument("--heroes", type=int, default=LoadProfile.heroes, help="Heroes seeded for the heroes scenarios")
+    parser.add_argument("--upload-size", type=int, default=LoadProfile.upload_size, help="Bytes per uploaded file")
+    parser.add_argument("--seed", type=int, default=LoadProfile.seed)
+    parser.add_argument("--output", type=Path, help="Save the results as JSON (e.g. as the next baseline)")
+    parser.add_argument("--baseline", type=Path, help="Results JSON to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Relative change counted as a regression")
+    args = parser.parse_args()
+
+    profile = LoadProfile(args.requests, args.concurrency, args.warmup, args.heroes, args.upload_size, args.seed)
+    run = run_on_server if args.server else run_in_process
+    results = {
+        "mode": "server" if args.server else "asgi",
+        "profile": asdict(profile),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "scenarios": {},
+    }
+    print(f"{'scenario':<14}{'requests':>9}{'errors':>8}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'RSS MB':>9}")
+    for name in args.scenarios:
+        with tempfile.TemporaryDirectory(prefix=f"bench-{name}-") as workdir:
+            if args.server:
+                result = run(name, profile, workdir)
+            else:
+                # A process per scenario: settings applied before the app is imported, RSS of its own
+                with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+                    result = executor.submit(run, name, profile, workdir).result()
+        results["scenarios"][name] = result
+        rss = f"{result['peak_rss_mb']:>9.1f}" if result["peak_rss_mb"] is not None else f"{'-':>9}"
+        print(f"{name:<14}{result['requests']:>9}{result['errors']:>8}{result['throughput']:>9.0f}"
+              f"{result['p50_ms']:>9.2f}{result['p95_ms']:>9.2f}{result['p99_ms']:>9.2f}{rss}")
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2) + "\n")
+    if args.baseline:
+        regressions = compare(results, json.loads(args.baseline.read_text()), args.tolerance)
+        if regressions:
+            print("\nRegressions:\n" + "\n".join(f"    {regression}" for regression in regressions))
+            sys.exit(1)
+        print("\nNo regression")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Latency of GET / alone and during a storm of POST /token logins, to show that the password
+hashing (on its own bounded pool, see core/workers.py) doesn't slow the event loop down.
+
+    python -m benchmarks.login_storm
+    python -m benchmarks.login_storm --seconds 20 --logins 128 --nice 0 10 19
+
+The app runs in a uvicorn subprocess (see benchmarks/server.py) with the demo users, once per
+--nice value of the hashing threads (PASSWORD_HASH_NICE). One client requests / back to back for
+--seconds, first alone and then while --logins clients log johndoe in as fast as they can. Past
+the pool's workers and queue the logins are answered 429, which is the load shedding at work,
+and those clients wait the Retry-After. The pool's counters come from /login/password-pool/stats.
+"""
+import argparse
+import asyncio
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from statistics import quantiles
+
+import httpx
+
+from benchmarks.load import ROOT, free_port, wait_until_up
+
+
+async def probe(client: httpx.AsyncClient, deadline: float) -> list[float]:
+    latencies = []
+    while time.perf_counter() < deadline:
+        start_time = time.perf_counter()
+        (await client.get("/")).raise_for_status()
+        latencies.append(time.perf_counter() - start_time)
+    return latencies
+
+
+async def log_in(client: httpx.AsyncClient, deadline: float, statuses: Counter):
+    while time.perf_counter() < deadline:
+        response = await client.post("/token", data={"username": "johndoe", "password": "secret"})
+        statuses[response.status_code] += 1
+        if response.status_code == 429:
+            await asyncio.sleep(float(response.headers.get("retry-after", 1)))
+
+
+async def run(base_url: str, seconds: float, logins: int) -> tuple[list[tuple], dict]:
+    limits = httpx.Limits(max_connections=logins + 1, max_keepalive_connections=logins + 1)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        await probe(client, time.perf_counter() + 1)    # Warm up
+        rows = [("idle", await probe(client, time.perf_counter() + seconds), Counter())]
+        statuses = Counter()
+        deadline = time.perf_counter() + seconds
+        latencies, *_ = await asyncio.gather(
+            probe(client, deadline), *[log_in(client, deadline, statuses) for _ in range(logins)]
+        )
+        rows.append((f"{logins} logins", latencies, statuses))
+        stats = (await client.get("/login/password-pool/stats")).json()
+    return rows, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=10, help="Per phase")
+    parser.add_argument("--logins", type=int, default=64, help="Concurrent clients logging in during the storm")
+    parser.add_argument("--nice", type=int, nargs="+", default=[0, 19], help="Nice values of the hashing threads")
+    args = parser.parse_args()
+
+    print(f"{'nice':<6}{'phase':<12}{'GET / rps':>10}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}{'logins 200':>12}{'429':>7}")
+    for nice in args.nice:
+        port = free_port()
+        with tempfile.TemporaryDirectory(prefix="bench-login-storm-") as workdir:
+            process = subprocess.Popen(
+                [sys.executable, "-m", "benchmarks.server", "--workdir", workdir, "--port", str(port),
+                 "--setting", f"PASSWORD_HASH_NICE={nice}"],
+                cwd=ROOT,
+            )
+            try:
+                base_url = f"http://127.0.0.1:{port}"
+                wait_until_up(base_url, process)
+                rows, stats = asyncio.run(run(base_url, args.seconds, args.logins))
+            finally:
+                process.terminate()
+                process.wait(10)
+
+        for phase, latencies, statuses in rows:
+            percentiles = quantiles(latencies, n=100, method="inclusive")
+            print(f"{nice:<6}{phase:<12}{len(latencies) / args.seconds:>10.0f}{percentiles[49] * 1000:>9.2f}"
+                  f"{percentiles[98] * 1000:>9.2f}{max(latencies) * 1000:>9.2f}{statuses[200]:>12}{statuses[429]:>7}")
+        print(f"{nice:<6}password pool: " + ", ".join(f"{name} {value}" for name, value in stats.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Requests per second on GET / (and on a CORS preflight) through the old middleware stack,
+@app.middleware("http") + CORSMiddleware, and the new one, ProcessTimeMiddleware + FastCORSMiddleware.
+
+    python -m benchmarks.middleware
+    python -m benchmarks.middleware --requests 50000 --concurrency 100
+
+The apps are called in-process as plain ASGI callables, so the numbers are the cost of the
+framework and middleware alone, without a server nor sockets.
+"""
+import argparse
+import asyncio
+import time
+
+from fastapi import FastAPI, Request
+from starlette.middleware.cors import CORSMiddleware
+
+from core.metrics import HTTPMetrics, MetricsRegistry
+from core.middleware import FastCORSMiddleware, ProcessTimeMiddleware
+from main import hello_api, origins
+
+
+CORS_OPTIONS = {"allow_origins": origins, "allow_credentials": True, "allow_methods": ["*"], "allow_headers": ["*"]}
+
+
+def before_app() -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(CORSMiddleware, **CORS_OPTIONS)
+    metrics = HTTPMetrics(MetricsRegistry())
+
+    @app.middleware("http")
+    async def add_process_time_header(request: Request, call_next):
+        metrics.start(request.method)
+        start_time = time.perf_counter()
+        response = await call_next(request)
+        process_time = time.perf_counter() - start_time
+        response.headers["X-Process-Time"] = str(process_time)
+        route = request.scope.get("route")
+        metrics.finish(request.method, route.path if route else "", response.status_code, process_time, None,
+                       int(response.headers.get("content-length", 0)))
+        return response
+
+    app.get("/")(hello_api)
+    return app
+
+
+def after_app() -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(FastCORSMiddleware, **CORS_OPTIONS)
+    app.add_middleware(ProcessTimeMiddleware, metrics=HTTPMetrics(MetricsRegistry()))
+    app.get("/")(hello_api)
+    return app
+
+
+def make_scope(method: str, headers: list[tuple[bytes, bytes]]) -> dict:
+    return {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method, "scheme": "http",
+        "path": "/", "raw_path": b"/", "root_path": "", "query_string": b"", "headers": headers,
+        "client": ("127.0.0.1", 12345), "server": ("127.0.0.1", 8000),
+    }
+
+
+async def call(app, method: str, headers: list[tuple[bytes, bytes]]) -> int:
+    status_code = 0
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status_code
+        if message["type"] == "http.response.start":
+            status_code = message["status"]
+
+    await app(make_scope(method, headers), receive, send)
+    return status_code
+
+
+async def requests_per_second(app, method: str, headers: list[tuple[bytes, bytes]], requests: int,
+                              concurrency: int) -> float:
+    async def client(count: int):
+        for _ in range(count):
+            assert await call(app, method, headers) == 200
+
+    await client(100)   # Warm up
+    start_time = time.perf_counter()
+    await asyncio.gather(*[client(requests // concurrency) for _ in range(concurrency)])
+    return requests // concurrency * concurrency / (time.perf_counter() - start_time)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    scenarios = {
+        "GET /": ("GET", [(b"host", b"localhost")]),
+        "GET / from an origin": ("GET", [(b"host", b"localhost"), (b"origin", b"http://localhost")]),
+        "OPTIONS / preflight": ("OPTIONS", [
+            (b"host", b"localhost"), (b"origin", b"http://localhost:8080"),
+            (b"access-control-request-method", b"POST"), (b"access-control-request-headers", b"x-token, content-type"),
+        ]),
+    }
+    print(f"{'scenario':<24}{'before rps':>12}{'after rps':>12}{'speedup':>10}")
+    for name, (method, headers) in scenarios.items():
+        before = asyncio.run(requests_per_second(before_app(), method, headers, args.requests, args.concurrency))
+        after = asyncio.run(requests_per_second(after_app(), method, headers, args.requests, args.concurrency))
+        print(f"{name:<24}{before:>12.0f}{after:>12.0f}{after / before:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Time POST /offers/ with big nested offers, answered the usual way and with a response the
+endpoint dumps itself, to see whether skipping FastAPI's response validation is worth it.
+
+    python -m benchmarks.offer_serialization
+    python -m benchmarks.offer_serialization --items 10000 --images 3 --repeat 5
+
+Both endpoints run in-process through httpx's ASGI transport. The phases of a request are
+also timed on their own: parsing and validating the body, then what FastAPI does with the
+returned model (validate it again and serialize it) against only serializing it.
+
+Pydantic hands model instances back as they are when it validates them (revalidate_instances
+is "never" by default), so don't expect a difference: the cost is in validating the body.
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import Any
+
+import httpx
+from fastapi import APIRouter, FastAPI, Response
+from pydantic import TypeAdapter
+
+from core.routing import FastJSONRoute
+from routers.offers import Offer
+
+
+def offer_body(items: int, images: int) -> bytes:
+    return json.dumps({
+        "name": "Big offer",
+        "description": "Benchmark",
+        "total_price": items * 1.5,
+        "items": [
+            {
+                "name": f"Item {i}",
+                "price": 1.5,
+                "tags": ["a", "b"],
+                "images": [{"url": f"https://example.com/{i}/{j}.png", "name": f"Image {j}"} for j in range(images)],
+            }
+            for i in range(items)
+        ],
+    }).encode()
+
+
+def offers_app(dumped: bool) -> FastAPI:
+    router = APIRouter(route_class=FastJSONRoute)
+    adapter = TypeAdapter(Offer)
+
+    async def create_offer(offer: Offer) -> Offer:
+        return offer
+
+    async def create_offer_dumped(offer: Offer) -> Offer:
+        # A Response is sent as it is, FastAPI neither validates nor serializes it
+        return Response(adapter.dump_json(offer), media_type="application/json")
+
+    router.post("/offers/")(create_offer_dumped if dumped else create_offer)
+    app = FastAPI()
+    app.include_router(router)
+    return app
+
+
+def best_time(func, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+async def best_request_time(app: FastAPI, body: bytes, repeat: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            response = await client.post("/offers/", content=body, headers={"content-type": "application/json"})
+            best = min(best, time.perf_counter() - start)
+            response.raise_for_status()
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=10000, help="Items in the offer")
+    parser.add_argument("--images", type=int, default=3, help="Images in each item")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs of each measure, the best one counts")
+    args = parser.parse_args()
+
+    body = offer_body(args.items, args.images)
+    offer = Offer.model_validate_json(body)
+    adapter = TypeAdapter(Offer)
+    print(f"Offer of {args.items} items with {args.images} images each, {len(body) / 1e6:.1f} MB of JSON\n")
+
+    phases: dict[str, Any] = {
+        "request: json.loads + validate": lambda: Offer.model_validate(json.loads(body)),
+        "response: validate + dump_json": lambda: adapter.dump_json(adapter.validate_python(offer, from_attributes=True)),
+        "response: dump_json": lambda: adapter.dump_json(offer),
+    }
+    for name, func in phases.items():
+        print(f"{name:<36}{best_time(func, args.repeat) * 1000:>10.1f} ms")
+
+    print()
+    for dumped in (False, True):
+        elapsed = asyncio.run(best_request_time(offers_app(dumped), body, args.repeat))
+        print(f"{'POST /offers/ ' + ('dumped' if dumped else 'validated'):<36}{elapsed * 1000:>10.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
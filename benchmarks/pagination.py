@@ -0,0 +1,73 @@
+"""
+Time page 1 and page 10,000 of GET /heroes/ in offset mode and in keyset (cursor) mode.
+
+    python -m benchmarks.pagination
+    python -m benchmarks.pagination --heroes 2000000 --page 20000 --repeat 20
+
+The statements are the ones the route runs, against a temporary SQLite database with the app's
+pragmas holding --heroes heroes. The cursor of a deep page is built from the row just before it,
+like the next_cursor of the previous page would be.
+"""
+import argparse
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from sqlmodel import Session, SQLModel, insert, select
+
+from core.db import get_engine
+from core.pagination import encode_cursor
+from routers.heroes import heroes_keyset_statement
+from routers.models import Hero
+
+
+def best_time(session: Session, statement, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        session.exec(statement).all()
+        best = min(best, time.perf_counter() - start_time)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--heroes", type=int, default=1_100_000)
+    parser.add_argument("--page", type=int, default=10_000, help="The deep page, counted from 1")
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=10, help="Runs per query, the best one counts")
+    args = parser.parse_args()
+
+    random.seed(0)
+    with tempfile.TemporaryDirectory() as directory:
+        engine = get_engine(f"sqlite:///{Path(directory) / 'heroes.db'}")
+        SQLModel.metadata.create_all(engine, tables=[Hero.__table__])
+        with Session(engine) as session:
+            for chunk_start in range(0, args.heroes, 100_000):
+                session.execute(insert(Hero), [
+                    {"name": f"Hero {random.randrange(10 ** 9):09d}", "age": random.randint(18, 90),
+                     "secret_name": f"Secret {number}"}
+                    for number in range(chunk_start, min(chunk_start + 100_000, args.heroes))
+                ])
+            session.commit()
+
+            offset = (args.page - 1) * args.limit
+            print(f"{'order':<7}{'mode':<9}{'page 1 ms':>11}{f'page {args.page} ms':>16}{'ratio':>9}")
+            for order_by, columns in (("id", (Hero.id,)), ("name", (Hero.name, Hero.id))):
+                offset_statements = [
+                    select(Hero).order_by(*columns).offset(page_offset).limit(args.limit) for page_offset in (0, offset)
+                ]
+                # The last row of the page before the deep one
+                last = session.exec(select(Hero).order_by(*columns).offset(offset - 1).limit(1)).one()
+                keyset_statements = [
+                    heroes_keyset_statement(cursor, order_by, args.limit)
+                    for cursor in ("", encode_cursor(order_by, getattr(last, order_by), last.id))
+                ]
+                for mode, statements in (("offset", offset_statements), ("keyset", keyset_statements)):
+                    first, deep = (best_time(session, statement, args.repeat) for statement in statements)
+                    print(f"{order_by:<7}{mode:<9}{first * 1000:>11.3f}{deep * 1000:>16.3f}{deep / first:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
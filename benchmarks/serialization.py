@@ -0,0 +1,96 @@
+"""
+Time the ways a JSON response can be rendered, on payloads shaped like ours.
+
+    python -m benchmarks.serialization
+    python -m benchmarks.serialization --rows 10000 --repeat 20
+
+jsonable_encoder + json is what FastAPI does for a route without a response model, pydantic is
+what it does with one (and what FastJSONRoute gives the others), orjson is FastJSONResponse.
+Also checks that the update_item payload comes out as the same bytes through all of them but
+the first.
+"""
+import argparse
+import time
+import uuid
+from datetime import datetime, time as dt_time, timedelta, timezone
+from typing import Any
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+from core.responses import FastJSONResponse
+from routers.items import Image, Item
+from routers.models import Hero
+from routers.users import BaseUser
+
+
+def update_item_payload() -> dict:
+    # What update_item returns, with the types it has before serialization
+    start = datetime(2024, 1, 1, 10, 0, 0, 123000, tzinfo=timezone.utc)
+    process_after = timedelta(seconds=3600.5)
+    return {
+        "itemId": uuid.UUID("3fa85f64-5717-4562-b3fc-2c963f66afa6"),
+        "user": BaseUser(username="johndoe", full_name="John Doe", email="johndoe@example.com"),
+        "importance": 3,
+        "start_datetime": start,
+        "end_datetime": datetime(2024, 1, 2, 10, 0, tzinfo=timezone(timedelta(hours=2))),
+        "process_after": process_after,
+        "repeat_at": dt_time(13, 0),
+        "start_process": start + process_after,
+        "duration": timedelta(hours=20, minutes=59, seconds=59.377),
+        "q": "x",
+        "item": Item(name="Foo", price=35.4, tax=3.2, tags=["a", "b"]).model_dump(),
+    }
+
+
+def payloads(rows: int) -> dict[str, Any]:
+    return {
+        "heroes": [Hero(id=i, name=f"Hero {i}", age=i % 90, secret_name=f"Secret {i}") for i in range(rows)],
+        "items": [
+            Item(name=f"Item {i}", price=i + 0.5, tax=1.5, images=[Image(url="https://example.com/a.png", name="a")])
+            for i in range(rows)
+        ],
+        "update_item": [update_item_payload() for _ in range(rows)],
+    }
+
+
+RENDERERS = {
+    "jsonable_encoder + json": lambda content: JSONResponse(jsonable_encoder(content)).body,
+    "pydantic": TypeAdapter(Any).dump_json,
+    "orjson": lambda content: FastJSONResponse(content).body,
+}
+
+
+def best_time(func, content, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(content)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000, help="Rows in each list payload")
+    parser.add_argument("--repeat", type=int, default=10, help="Runs per renderer, the best one counts")
+    args = parser.parse_args()
+
+    single = update_item_payload()
+    reference = RENDERERS["pydantic"](single)
+    for name in ("pydantic", "orjson"):
+        print(f"update_item through {name}: {'same bytes' if RENDERERS[name](single) == reference else 'DIFFERENT'}")
+    print(f"    {reference.decode()}")
+
+    print(f"\n{'payload':<14}{'renderer':<26}{'ms':>10}{'speedup':>10}")
+    for payload_name, content in payloads(args.rows).items():
+        baseline = None
+        for name, func in RENDERERS.items():
+            elapsed = best_time(func, content, args.repeat)
+            baseline = baseline or elapsed
+            print(f"{payload_name:<14}{name:<26}{elapsed * 1000:>10.2f}{baseline / elapsed:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
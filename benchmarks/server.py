@@ -0,0 +1,51 @@
+"""
+Serve the app with uvicorn from a benchmark work directory: its own database, upload store,
+files and JWT keys, and no login rate limit. benchmarks.load starts one per scenario.
+
+    python -m benchmarks.server --workdir /tmp/bench --port 8123
+    python -m benchmarks.server --workdir /tmp/bench --setting PASSWORD_HASH_WORKERS=1
+"""
+import argparse
+import json
+from pathlib import Path
+
+from core.config import settings
+
+
+def configure(workdir: str):
+    """Point the settings to workdir. Must run before anything imports core.db, which builds the engines"""
+    root = Path(workdir).resolve()
+    root.mkdir(parents=True, exist_ok=True)
+    settings.DATABASE_URL = f"sqlite:///{root / 'database.db'}"
+    settings.ASYNC_DATABASE_URL = f"sqlite+aiosqlite:///{root / 'database.db'}"
+    settings.UPLOAD_STORE_DIR = str(root / "uploads")
+    settings.FILES_ROOT = str(root / "files")
+    settings.JWT_KEY_DIR = str(root / "keys")
+    # Every login comes from the same client and user: the limits would answer 429 to nearly all of them
+    settings.LOGIN_RATE_LIMIT_PER_IP = (10 ** 9, 1)
+    settings.LOGIN_RATE_LIMIT_PER_USERNAME = (10 ** 9, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workdir", required=True)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8123)
+    parser.add_argument("--setting", action="append", default=[], metavar="NAME=VALUE",
+                        help="Override a setting, the value is JSON")
+    args = parser.parse_args()
+
+    configure(args.workdir)
+    for setting in args.setting:
+        name, value = setting.split("=", 1)
+        if not hasattr(settings, name):
+            parser.error(f"Unknown setting {name}")
+        setattr(settings, name, json.loads(value))
+    import uvicorn
+    from main import app
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning", access_log=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Read throughput of GET /heroes/{hero_id} while writers hammer POST /heroes/, with the engine as
+it was (rollback journal, default pool) and as core/db.py configures it (WAL, pragmas, a pool
+sized to the threadpool).
+
+    python -m benchmarks.sqlite_concurrency
+    python -m benchmarks.sqlite_concurrency --seconds 20 --readers 64 --writers 4
+
+Each configuration runs in a process of its own, calling the app in-process through httpx's
+ASGI transport, on a fresh database seeded with --heroes heroes. The hero cache is off so every
+read reaches SQLite. Errors are the answers other than 200 (e.g. "database is locked").
+"""
+import argparse
+import asyncio
+import random
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from statistics import quantiles
+
+import httpx
+
+
+CONFIGURATIONS = {
+    # What core/db.py did before: create_engine() defaults, SQLite's rollback journal
+    "rollback journal": {"SQLITE_PRAGMAS": {"journal_mode": "DELETE"}, "DB_POOL_SIZE": 5, "DB_MAX_OVERFLOW": 10},
+    "configured": {},
+}
+
+
+def run(configuration: str, seconds: float, readers: int, writers: int, heroes: int) -> dict:
+    from benchmarks.server import configure
+    from core.config import settings
+
+    workdir = tempfile.mkdtemp(prefix="bench-sqlite-")
+    configure(workdir)
+    settings.HERO_CACHE_MAX_BYTES = 0
+    for name, value in CONFIGURATIONS[configuration].items():
+        setattr(settings, name, value)
+    from main import app
+
+    latencies = []
+    counts = {"reads": 0, "writes": 0, "read errors": 0, "write errors": 0}
+
+    async def reader(client: httpx.AsyncClient, deadline: float, rng: random.Random):
+        while time.perf_counter() < deadline:
+            start_time = time.perf_counter()
+            response = await client.get(f"/heroes/{rng.randint(1, heroes)}")
+            latencies.append(time.perf_counter() - start_time)
+            counts["reads" if response.status_code == 200 else "read errors"] += 1
+
+    async def writer(client: httpx.AsyncClient, deadline: float, rng: random.Random):
+        while time.perf_counter() < deadline:
+            number = rng.randrange(10 ** 6)
+            response = await client.post("/heroes/", json={"name": f"Hero {number}", "secret_name": f"S {number}"})
+            counts["writes" if response.status_code == 200 else "write errors"] += 1
+
+    async def main() -> dict:
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://testserver", timeout=60) as client:
+                rows = [{"name": f"Hero {number}", "secret_name": f"S {number}"} for number in range(heroes)]
+                (await client.post("/heroes/bulk", json=rows)).raise_for_status()
+                deadline = time.perf_counter() + seconds
+                await asyncio.gather(
+                    *[reader(client, deadline, random.Random(number)) for number in range(readers)],
+                    *[writer(client, deadline, random.Random(-number - 1)) for number in range(writers)],
+                )
+        percentiles = quantiles(latencies, n=100, method="inclusive")
+        return {
+            **counts,
+            "reads/s": counts["reads"] / seconds,
+            "writes/s": counts["writes"] / seconds,
+            "p50 ms": percentiles[49] * 1000,
+            "p99 ms": percentiles[98] * 1000,
+        }
+
+    return asyncio.run(main())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--readers", type=int, default=32, help="Concurrent reading clients")
+    parser.add_argument("--writers", type=int, default=2, help="Concurrent writing clients")
+    parser.add_argument("--heroes", type=int, default=10_000, help="Heroes seeded first")
+    args = parser.parse_args()
+
+    print(f"{'configuration':<18}{'reads/s':>9}{'p50 ms':>9}{'p99 ms':>9}{'writes/s':>10}{'errors':>8}")
+    for configuration in CONFIGURATIONS:
+        # A process each: the settings must be set before the app (and its engine) is imported
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+            result = executor.submit(run, configuration, args.seconds, args.readers, args.writers, args.heroes).result()
+        errors = result["read errors"] + result["write errors"]
+        print(f"{configuration:<18}{result['reads/s']:>9.0f}{result['p50 ms']:>9.2f}{result['p99 ms']:>9.2f}"
+              f"{result['writes/s']:>10.0f}{errors:>8}")
+
+
+if __name__ == "__main__":
+    main()
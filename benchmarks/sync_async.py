@@ -0,0 +1,100 @@
+"""
+p50/p99 latency of the sync hero routes (threadpool + Session) against the async ones
+(AsyncSession on aiosqlite) at 500 concurrent clients.
+
+    python -m benchmarks.sync_async
+    python -m benchmarks.sync_async --requests 20000 --concurrency 1000
+
+The app is called in-process through httpx's ASGI transport, on a fresh database seeded with
+--heroes heroes, in a process of its own so the settings apply before the engines are built.
+The hero cache is off so every read reaches SQLite.
+"""
+import argparse
+import asyncio
+import random
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from statistics import quantiles
+
+import httpx
+
+
+ROUTES = {
+    "GET /heroes/{hero_id}": lambda rng, heroes: ("GET", f"/heroes/{rng.randint(1, heroes)}", None),
+    "GET /heroes/?limit=20": lambda rng, heroes: ("GET", f"/heroes/?offset={rng.randrange(heroes)}&limit=20", None),
+    "POST /heroes/": lambda rng, heroes: ("POST", "/heroes/", {"name": f"Hero {rng.randrange(10 ** 6)}", "secret_name": "S"}),
+}
+
+
+async def measure(client: httpx.AsyncClient, prefix: str, route: str, requests: int, concurrency: int,
+                  heroes: int) -> tuple[float, float, float, dict[int, tuple[int, str]]]:
+    """Requests per second, p50 and p99 in ms, and the failures: status -> (count, first body)"""
+    rng = random.Random(0)
+    planned = [ROUTES[route](rng, heroes) for _ in range(requests)]
+    pending = iter(planned)
+    latencies = []
+    failures = {}
+
+    async def worker():
+        for method, url, body in pending:
+            start_time = time.perf_counter()
+            response = await client.request(method, prefix + url, json=body)
+            latencies.append(time.perf_counter() - start_time)
+            if response.status_code != 200:
+                count, body = failures.get(response.status_code, (0, response.text[:200]))
+                failures[response.status_code] = (count + 1, body)
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start_time
+    percentiles = quantiles(latencies, n=100, method="inclusive")
+    return requests / elapsed, percentiles[49] * 1000, percentiles[98] * 1000, failures
+
+
+def run(requests: int, concurrency: int, heroes: int) -> list[tuple]:
+    from benchmarks.server import configure
+    from core.config import settings
+
+    configure(tempfile.mkdtemp(prefix="bench-sync-async-"))
+    settings.HERO_CACHE_MAX_BYTES = 0
+    from main import app
+
+    async def main() -> list[tuple]:
+        results = []
+        async with app.router.lifespan_context(app):
+            # Pool timeouts and the like count as errors (500) rather than stopping the run
+            transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+            async with httpx.AsyncClient(transport=transport, base_url="http://testserver", timeout=120) as client:
+                rows = [{"name": f"Hero {number}", "secret_name": f"S {number}"} for number in range(heroes)]
+                (await client.post("/heroes/bulk", json=rows)).raise_for_status()
+                for route in ROUTES:
+                    for path, prefix in (("sync", ""), ("async", "/async")):
+                        await measure(client, prefix, route, concurrency, concurrency, heroes)   # Warm up
+                        results.append((route, path, *await measure(client, prefix, route, requests, concurrency, heroes)))
+        return results
+
+    return asyncio.run(main())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=10000, help="Timed requests per route and path")
+    parser.add_argument("--concurrency", type=int, default=500)
+    parser.add_argument("--heroes", type=int, default=10_000, help="Heroes seeded first")
+    args = parser.parse_args()
+
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+        results = executor.submit(run, args.requests, args.concurrency, args.heroes).result()
+    print(f"{'route':<24}{'path':<7}{'rps':>8}{'p50 ms':>9}{'p99 ms':>9}{'errors':>8}")
+    for route, path, rps, p50, p99, failures in results:
+        errors = sum(count for count, _ in failures.values())
+        print(f"{route:<24}{path:<7}{rps:>8.0f}{p50:>9.1f}{p99:>9.1f}{errors:>8}")
+    for route, path, *_, failures in results:
+        for status_code, (count, body) in sorted(failures.items()):
+            print(f"{route} ({path}): {count} x {status_code}, e.g. {body!r}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Check that POST /file/stream/ takes a 2 GiB upload in constant memory: the server's peak RSS
+must not grow by more than --max-growth-mb while it reads it.
+
+    python -m benchmarks.upload_memory
+    python -m benchmarks.upload_memory --size 8589934592 --max-growth-mb 16
+
+The app runs in a uvicorn subprocess (see benchmarks/server.py) so its memory is its own. The
+body is generated chunk by chunk and sent chunked, so the client doesn't hold it either. The
+growth is the server's peak RSS (VmHWM) after the upload minus its RSS before it, after a small
+warm-up upload. Linux only: the figures come from /proc. The exit status is 1 when the growth
+goes over the budget or the size or SHA-256 answered are wrong.
+"""
+import argparse
+import hashlib
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+from benchmarks.load import ROOT, free_port, peak_rss_mb, wait_until_up
+
+
+BOUNDARY = "upload-memory-benchmark"
+
+
+def rss_mb(pid: int) -> float:
+    for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+        if line.startswith("VmRSS:"):
+            return int(line.split()[1]) / 2 ** 10
+    raise RuntimeError(f"No VmRSS for process {pid}")
+
+
+def multipart_body(size: int, chunk_size: int, digest):
+    """A multipart body with one size bytes "file" field, in chunks. digest is updated with the file"""
+    yield (f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="file"; filename="big.bin"\r\n'
+           f'Content-Type: application/octet-stream\r\n\r\n').encode()
+    chunk = bytes(range(256)) * (chunk_size // 256)
+    sent = 0
+    while sent < size:
+        data = chunk[:size - sent]
+        digest.update(data)
+        sent += len(data)
+        yield data
+    yield f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+def upload(client: httpx.Client, size: int, chunk_size: int) -> tuple[dict, str]:
+    digest = hashlib.sha256()
+    response = client.post(
+        "/file/stream/",
+        content=multipart_body(size, chunk_size, digest),
+        headers={"content-type": f"multipart/form-data; boundary={BOUNDARY}"},
+    )
+    response.raise_for_status()
+    return response.json(), digest.hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=2 * 2 ** 30, help="Bytes uploaded")
+    parser.add_argument("--chunk-size", type=int, default=64 * 1024, help="Bytes sent at a time")
+    parser.add_argument("--max-growth-mb", type=float, default=32, help="Budget for the growth of the peak RSS")
+    args = parser.parse_args()
+
+    port = free_port()
+    with tempfile.TemporaryDirectory(prefix="bench-upload-memory-") as workdir:
+        process = subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.server", "--workdir", workdir, "--port", str(port)], cwd=ROOT
+        )
+        try:
+            base_url = f"http://127.0.0.1:{port}"
+            wait_until_up(base_url, process)
+            with httpx.Client(base_url=base_url, timeout=None) as client:
+                upload(client, args.chunk_size * 16, args.chunk_size)     # Warm up
+                before = rss_mb(process.pid)
+                start_time = time.perf_counter()
+                answer, sha256 = upload(client, args.size, args.chunk_size)
+                elapsed = time.perf_counter() - start_time
+            peak = peak_rss_mb(process.pid)
+        finally:
+            process.terminate()
+            process.wait(10)
+
+    growth = peak - before
+    print(f"uploaded {args.size / 2 ** 20:.0f} MiB in {elapsed:.1f} s ({args.size / 2 ** 20 / elapsed:.0f} MiB/s)")
+    print(f"server RSS before {before:.1f} MiB, peak {peak:.1f} MiB, growth {growth:.1f} MiB"
+          f" (budget {args.max_growth_mb:.0f} MiB)")
+    failures = []
+    if answer.get("file_size") != args.size:
+        failures.append(f"file_size {answer.get('file_size')}, {args.size} sent")
+    if answer.get("sha256") != sha256:
+        failures.append(f"sha256 {answer.get('sha256')}, {sha256} sent")
+    if growth > args.max_growth_mb:
+        failures.append(f"the peak RSS grew by {growth:.1f} MiB, over the {args.max_growth_mb:.0f} MiB budget")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
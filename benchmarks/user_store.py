@@ -0,0 +1,77 @@
+"""
+Latency of UserStore lookups as the user table grows to a million rows, from the database
+(the unique index on username) and from the cache.
+
+    python -m benchmarks.user_store
+    python -m benchmarks.user_store --sizes 1000 100000 1000000 --lookups 5000
+
+The users are inserted in a temporary SQLite database with the app's pragmas. Each lookup is
+of a random existing username; "database" uses a store without a cache, "cached" one that
+already holds the sampled users.
+"""
+import argparse
+import random
+import tempfile
+import time
+from pathlib import Path
+from statistics import quantiles
+
+from sqlmodel import Session, SQLModel, insert
+
+from core.db import get_engine
+from routers.models import UserRecord
+from routers.users import UserStore
+
+
+def user_row(number: int) -> dict:
+    return {
+        "username": f"user{number}",
+        "email": f"user{number}@example.com",
+        "full_name": f"User {number}",
+        "disabled": False,
+        "hashed_password": "$argon2id$v=19$m=19456,t=2,p=1$benchmark",
+    }
+
+
+def lookup_latencies(store: UserStore, usernames: list[str]) -> list[float]:
+    latencies = []
+    for username in usernames:
+        start_time = time.perf_counter()
+        assert store.get(username) is not None
+        latencies.append(time.perf_counter() - start_time)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument("--lookups", type=int, default=2000, help="Lookups per size and store")
+    args = parser.parse_args()
+
+    random.seed(0)
+    with tempfile.TemporaryDirectory() as directory:
+        engine = get_engine(f"sqlite:///{Path(directory) / 'users.db'}")
+        SQLModel.metadata.create_all(engine, tables=[UserRecord.__table__])
+        print(f"{'users':>10}{'store':>10}{'p50 us':>10}{'p99 us':>10}")
+        count = 0
+        for size in sorted(args.sizes):
+            with Session(engine) as session:
+                for chunk_start in range(count, size, 50_000):
+                    rows = [user_row(number) for number in range(chunk_start, min(chunk_start + 50_000, size))]
+                    session.execute(insert(UserRecord), rows)
+                session.commit()
+            count = size
+
+            usernames = [f"user{random.randrange(size)}" for _ in range(args.lookups)]
+            stores = {
+                "database": UserStore(engine, max_entries=0, ttl=0),
+                "cached": UserStore(engine, max_entries=args.lookups, ttl=3600),
+            }
+            lookup_latencies(stores["cached"], usernames)   # Fill its cache
+            for name, store in stores.items():
+                percentiles = quantiles(lookup_latencies(store, usernames), n=100, method="inclusive")
+                print(f"{size:>10}{name:>10}{percentiles[49] * 1e6:>10.1f}{percentiles[98] * 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+import hashlib
+import hmac
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import Engine
+from sqlmodel import Session, insert, select, update
+
+from routers.models import ApiKeyRecord
+
+
+@dataclass(frozen=True)
+class ApiKey:
+    id: int
+    prefix: str
+    key_hash: bytes
+    name: str
+    scopes: frozenset[str]
+
+
+def hash_api_key(key: str) -> bytes:
+    # Keys are long random strings, not passwords: a fast hash is enough, nobody can guess its input
+    return hashlib.sha256(key.encode()).digest()
+
+
+class ApiKeyRegistry:
+    """
+    API keys saved in the database as SHA-256 hashes, found by their first prefix_length
+    characters. The keys sharing a prefix (usually one) are cached for ttl seconds, so checking
+    a key is a dict lookup and a constant-time compare of the hashes, however many keys there
+    are. ttl bounds how late a worker learns of a key revoked by another.
+
+    The prefixes no key has are cached too, in an LRU of their own bounded by max_missing, so
+    a flood of random keys can't push the valid ones out.
+    """
+
+    def __init__(self, engine: Engine, prefix_length: int, max_entries: int, ttl: float, max_missing: int):
+        self.engine = engine
+        self.prefix_length = prefix_length
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_missing = max_missing
+        self._cache: OrderedDict[str, tuple[tuple[ApiKey, ...], float]] = OrderedDict()
+        self._missing: OrderedDict[str, float] = OrderedDict()     # prefix -> expires_at
+        self._lock = threading.Lock()
+
+    def generate(self) -> str:
+        return "ak_" + secrets.token_urlsafe(32)
+
+    def _cached(self, prefix: str) -> tuple[ApiKey, ...] | None:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._cache.get(prefix)
+            if entry is not None and entry[1] > now:
+                self._cache.move_to_end(prefix)
+                return entry[0]
+            expires_at = self._missing.get(prefix)
+            if expires_at is not None and expires_at > now:
+                self._missing.move_to_end(prefix)
+                return ()
+        return None
+
+    def _load(self, prefix: str) -> tuple[ApiKey, ...]:
+        keys = self._cached(prefix)
+        if keys is not None:
+            return keys
+        with Session(self.engine) as session:
+            records = session.exec(
+                select(ApiKeyRecord).where(ApiKeyRecord.prefix == prefix, ApiKeyRecord.revoked == False)  # noqa: E712
+            ).all()
+        keys = tuple(
+            ApiKey(record.id, record.prefix, bytes.fromhex(record.key_hash), record.name, frozenset(record.scopes.split()))
+            for record in records
+        )
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            if keys:
+                self._cache[prefix] = (keys, expires_at)
+                self._cache.move_to_end(prefix)
+                while len(self._cache) > self.max_entries:
+                    self._cache.popitem(last=False)
+            else:
+                self._missing[prefix] = expires_at
+                self._missing.move_to_end(prefix)
+                while len(self._missing) > self.max_missing:
+                    self._missing.popitem(last=False)
+        return keys
+
+    def _match(self, candidates: tuple[ApiKey, ...], key: str, scopes: frozenset[str] | set[str]) -> ApiKey | None:
+        key_hash = hash_api_key(key)
+        found = None
+        for candidate in candidates:
+            # Compare them all, so the time doesn't tell which candidate matched
+            if hmac.compare_digest(candidate.key_hash, key_hash):
+                found = candidate
+        if found is None or not scopes <= found.scopes:
+            return None
+        return found
+
+    def verify(self, key: str, scopes: frozenset[str] | set[str] = frozenset()) -> ApiKey | None:
+        """The key if it is registered, not revoked and has all the scopes, else None"""
+        if len(key) < self.prefix_length:
+            return None
+        return self._match(self._load(key[:self.prefix_length]), key, scopes)
+
+    async def verify_async(self, key: str, scopes: frozenset[str] | set[str] = frozenset()) -> ApiKey | None:
+        """verify() for the event loop: a prefix that isn't cached is loaded in the threadpool"""
+        if len(key) < self.prefix_length:
+            return None
+        prefix = key[:self.prefix_length]
+        candidates = self._cached(prefix)
+        if candidates is None:
+            candidates = await run_in_threadpool(self._load, prefix)
+        return self._match(candidates, key, scopes)
+
+    def add(self, name: str, scopes: list[str], key: str | None = None) -> tuple[str, ApiKeyRecord]:
+        """Register a key (a new random one by default). The plain key is returned once and never stored"""
+        key = key or self.generate()
+        record = ApiKeyRecord(
+            prefix=key[:self.prefix_length], key_hash=hash_api_key(key).hex(), name=name, scopes=" ".join(scopes)
+        )
+        with Session(self.engine) as session:
+            session.add(record)
+            session.commit()
+            session.refresh(record)
+        self.invalidate(record.prefix)
+        return key, record
+
+    def add_missing(self, keys: list[tuple[str, str, list[str]]]):
+        """Register the (key, name, scopes) that aren't registered yet"""
+        hashes = {hash_api_key(key).hex(): (key, name, scopes) for key, name, scopes in keys}
+        with Session(self.engine) as session:
+            existing = set(session.exec(select(ApiKeyRecord.key_hash).where(ApiKeyRecord.key_hash.in_(list(hashes)))))
+            rows = [
+                {
+                    "prefix": key[:self.prefix_length], "key_hash": key_hash, "name": name,
+                    "scopes": " ".join(scopes), "revoked": False, "created_at": time.time(),
+                }
+                for key_hash, (key, name, scopes) in hashes.items() if key_hash not in existing
+            ]
+            if rows:
+                session.execute(insert(ApiKeyRecord), rows)
+                session.commit()
+        for row in rows:
+            self.invalidate(row["prefix"])
+
+    def revoke(self, key_id: int) -> bool:
+        with Session(self.engine) as session:
+            record = session.get(ApiKeyRecord, key_id)
+            if record is None or record.revoked:
+                return False
+            session.execute(update(ApiKeyRecord).where(ApiKeyRecord.id == key_id).values(revoked=True))
+            session.commit()
+            prefix = record.prefix
+        self.invalidate(prefix)
+        return True
+
+    def invalidate(self, prefix: str):
+        with self._lock:
+            self._cache.pop(prefix, None)
+            self._missing.pop(prefix, None)
@@ -0,0 +1,186 @@
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any
+
+from pydantic import BaseModel
+
+
+class CacheStats(BaseModel):
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    invalidations: int = 0
+    entries: int = 0
+    size_bytes: int = 0
+    max_bytes: int | None = None
+
+
+class Cache(ABC):
+    """
+    Byte-oriented key/value cache. Values are already serialized, so their size is known.
+
+    A value read from the database may be stale by the time it is cached, if the key was deleted
+    meanwhile. So take generation(key) before reading it and pass it to set(), which then skips
+    the value if the key was deleted since.
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> bytes | None:
+        ...
+
+    @abstractmethod
+    def generation(self, key: str) -> int:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value: bytes, ttl: float | None = None, generation: int | None = None):
+        ...
+
+    @abstractmethod
+    def delete(self, *keys: str):
+        ...
+
+    @abstractmethod
+    def stats(self) -> CacheStats:
+        ...
+
+
+class LRUCache(Cache):
+    """
+    In-process LRU cache with TTL, bounded by the memory taken by its entries (not by their count)
+
+    Every delete ticks a counter and leaves a tombstone with its tick, the generation is the
+    current tick. The newest max_tombstones are kept: a generation older than the tombstones
+    dropped can't be checked, so set() skips its value.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float | None = None, max_tombstones: int = 10000):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_tombstones = max_tombstones
+        self._entries: OrderedDict[str, tuple[bytes, float | None, int]] = OrderedDict()
+        self._tombstones: OrderedDict[str, int] = OrderedDict()     # key -> tick of its last delete
+        self._tick = 0
+        self._oldest_tick = 0     # Tick of the newest tombstone dropped
+        self._lock = threading.Lock()
+        self._stats = CacheStats(max_bytes=max_bytes)
+
+    @staticmethod
+    def entry_size(key: str, value: bytes) -> int:
+        return sys.getsizeof(key) + sys.getsizeof(value)
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats.misses += 1
+                return None
+            value, expires_at, size = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                self._remove(key)
+                self._stats.expirations += 1
+                self._stats.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats.hits += 1
+            return value
+
+    def generation(self, key: str) -> int:
+        with self._lock:
+            return self._tick
+
+    def set(self, key: str, value: bytes, ttl: float | None = None, generation: int | None = None):
+        size = self.entry_size(key, value)
+        if size > self.max_bytes:
+            return
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            if generation is not None and (
+                    self._tombstones.get(key, 0) > generation or self._oldest_tick > generation):
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, expires_at, size)
+            self._stats.size_bytes += size
+            while self._stats.size_bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._stats.evictions += 1
+
+    def delete(self, *keys: str):
+        with self._lock:
+            for key in keys:
+                self._tick += 1
+                self._tombstones[key] = self._tick
+                self._tombstones.move_to_end(key)
+                if key in self._entries:
+                    self._remove(key)
+                    self._stats.invalidations += 1
+            while len(self._tombstones) > self.max_tombstones:
+                _, self._oldest_tick = self._tombstones.popitem(last=False)
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return self._stats.model_copy(update={"entries": len(self._entries)})
+
+    def _remove(self, key: str):
+        _, _, size = self._entries.pop(key)
+        self._stats.size_bytes -= size
+
+
+class RedisCache(Cache):
+    """
+    Cache on any client that speaks the Redis commands GET, SET (with EX) and DELETE,
+    like redis-py or a local stand-in. Memory bounds and eviction are left to the server
+    (maxmemory + allkeys-lru), so only hits, misses and invalidations are counted here.
+
+    A delete also writes a tombstone key, holding a new generation, for as long as the ttl (a
+    minute without one). set() checks it right before writing: there is a small window left
+    between the two, closing it would take WATCH/MULTI or a script.
+    """
+
+    def __init__(self, client: Any, ttl: float | None = None, prefix: str = "cache:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._stats = CacheStats()
+
+    def get(self, key: str) -> bytes | None:
+        value = self.client.get(self.prefix + key)
+        with self._lock:
+            if value is None:
+                self._stats.misses += 1
+            else:
+                self._stats.hits += 1
+        return value
+
+    def _tombstone_key(self, key: str) -> str:
+        return self.prefix + "deleted:" + key
+
+    def generation(self, key: str) -> int:
+        return int(self.client.get(self._tombstone_key(key)) or 0)
+
+    def set(self, key: str, value: bytes, ttl: float | None = None, generation: int | None = None):
+        if generation is not None and self.generation(key) != generation:
+            return
+        ttl = self.ttl if ttl is None else ttl
+        self.client.set(self.prefix + key, value, ex=max(1, int(ttl)) if ttl else None)
+
+    def delete(self, *keys: str):
+        if keys:
+            generation = time.time_ns()
+            for key in keys:
+                self.client.set(self._tombstone_key(key), generation, ex=max(1, int(self.ttl or 60)))
+            self.client.delete(*[self.prefix + key for key in keys])
+            with self._lock:
+                self._stats.invalidations += len(keys)
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return self._stats.model_copy()
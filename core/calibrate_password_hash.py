@@ -0,0 +1,78 @@
+"""
+Pick the password hash cost for this hardware from a target verification time.
+
+    python -m core.calibrate_password_hash --target-ms 250
+    python -m core.calibrate_password_hash --scheme bcrypt --target-ms 100
+
+Prints the PASSWORD_SCHEME_SETTINGS entries to put in core/config.py.
+"""
+import argparse
+import time
+
+from passlib.hash import argon2, bcrypt
+
+from core.config import settings
+
+
+def measure(handler, repeat: int) -> float:
+    """Best verification time, in seconds, of a hash made with this handler"""
+    hashed = handler.hash("calibration-password")
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        handler.verify("calibration-password", hashed)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def calibrate_bcrypt(target: float, repeat: int) -> dict[str, int]:
+    # Each round doubles the work, so one measurement is enough to extrapolate
+    base_rounds = 8
+    base_time = measure(bcrypt.using(rounds=base_rounds), repeat)
+    rounds = base_rounds
+    while rounds < 31 and base_time * 2 ** (rounds + 1 - base_rounds) <= target:
+        rounds += 1
+    return {"bcrypt__rounds": max(rounds, 10)}
+
+
+def calibrate_argon2(target: float, repeat: int, memory_cost: int, parallelism: int) -> dict[str, int | str]:
+    # Memory is the main defense of argon2id, so it stays fixed and the time cost grows to the target
+    def handler(time_cost: int):
+        return argon2.using(type="ID", memory_cost=memory_cost, parallelism=parallelism, time_cost=time_cost)
+
+    time_cost = 1
+    while measure(handler(time_cost + 1), repeat) <= target:
+        time_cost += 1
+    return {
+        "argon2__type": "ID",
+        "argon2__memory_cost": memory_cost,
+        "argon2__time_cost": time_cost,
+        "argon2__parallelism": parallelism,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scheme", choices=["argon2", "bcrypt"], default=settings.PASSWORD_SCHEMES[0])
+    parser.add_argument("--target-ms", type=float, default=250, help="Target verification time")
+    parser.add_argument("--repeat", type=int, default=3, help="Measurements per cost, the best one counts")
+    parser.add_argument("--memory-cost", type=int, default=settings.PASSWORD_SCHEME_SETTINGS.get("argon2__memory_cost", 19456),
+                        help="argon2 memory in KiB")
+    parser.add_argument("--parallelism", type=int, default=settings.PASSWORD_SCHEME_SETTINGS.get("argon2__parallelism", 1))
+    args = parser.parse_args()
+
+    target = args.target_ms / 1000
+    if args.scheme == "bcrypt":
+        scheme_settings = calibrate_bcrypt(target, args.repeat)
+        handler = bcrypt.using(rounds=scheme_settings["bcrypt__rounds"])
+    else:
+        scheme_settings = calibrate_argon2(target, args.repeat, args.memory_cost, args.parallelism)
+        handler = argon2.using(**{key.removeprefix("argon2__"): value for key, value in scheme_settings.items()})
+
+    print(f"Verification takes {measure(handler, args.repeat) * 1000:.0f} ms (target {args.target_ms:.0f} ms) with:")
+    for key, value in scheme_settings.items():
+        print(f"    {key!r}: {value!r},")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,73 @@
 class Settings:
     PROJECT_NAME: str = "FastAPI First Steps"
     PROJECT_VERSION: str = "0.0.1"
+    DEBUG: bool = False     # Tracebacks in error responses, X-DB-Queries and X-DB-Time headers with DB_PROFILING
+    # Render JSON with pydantic-core/orjson instead of jsonable_encoder + json (see core/routing.py)
+    FAST_JSON_RESPONSES: bool = False
+    HEROES_BULK_CHUNK_SIZE: int = 500
+    HERO_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    HERO_CACHE_TTL: float | None = 300
+    UPLOAD_STORE_DIR: str = "uploads"
+    UPLOAD_WORKERS: int = 8
+    MAX_UPLOAD_FILE_SIZE: int | None = None
+    PASSWORD_HASH_WORKERS: int = 4      # bcrypt and argon2 release the GIL, so up to one per CPU core
+    PASSWORD_HASH_QUEUE: int = 32
+    # Nice value of the hashing threads (Linux): a login storm takes the CPU the event loop leaves
+    PASSWORD_HASH_NICE: int = 19
+    # The first scheme hashes new passwords, the others are only verified and migrated on login.
+    # Tune the costs for this hardware with: python -m core.calibrate_password_hash
+    PASSWORD_SCHEMES: list[str] = ["argon2", "bcrypt"]
+    PASSWORD_SCHEME_SETTINGS: dict[str, str | int] = {
+        "argon2__type": "ID",
+        "argon2__memory_cost": 19456,   # KiB
+        "argon2__time_cost": 2,
+        "argon2__parallelism": 1,
+        "bcrypt__rounds": 12,
+    }
+    TOKEN_CACHE_MAX_ENTRIES: int = 10000
+    TOKEN_CACHE_MAX_TTL: float = 60
+    USER_CACHE_MAX_ENTRIES: int = 10000
+    USER_CACHE_TTL: float = TOKEN_CACHE_MAX_TTL     # How late a worker may learn of a user changed by another one
+    API_KEY_PREFIX_LENGTH: int = 8
+    API_KEY_CACHE_MAX_ENTRIES: int = 100000
+    API_KEY_CACHE_TTL: float = 30    # How late a worker may learn of a key revoked by another one
+    API_KEY_MISSING_CACHE_MAX_ENTRIES: int = 10000     # Prefixes of no key, apart so they can't evict the valid ones
+    REFRESH_TOKEN_EXPIRE_DAYS: float = 7
+    # Token buckets on the login routes: (burst, seconds to refill it)
+    LOGIN_RATE_LIMIT_PER_IP: tuple[int, float] = (30, 60)
+    LOGIN_RATE_LIMIT_PER_USERNAME: tuple[int, float] = (5, 60)
+    RATE_LIMIT_MAX_KEYS: int = 100000
+    REVOCATION_SYNC_SECONDS: float = 5     # How late a worker may learn of a token revoked by another one
+
+    # RS256 or EdDSA sign with rotating key pairs published at /.well-known/jwks.json,
+    # HS256 signs with the shared SECRET_KEY of core/security.py
+    JWT_ALGORITHM: str = "EdDSA"
+    JWT_KEY_DIR: str = "keys"
+    JWT_KEY_ROTATION_DAYS: float = 30
+    JWT_KEY_OVERLAP_MINUTES: float = REFRESH_TOKEN_EXPIRE_DAYS * 24 * 60 + 60     # Longer than any token lifetime
+    SIGNUP_BATCH_MAX_SIZE: int = 32
+    FILES_ROOT: str = "files"
+    # Sampling profiler of /admin/profile and of the requests with an X-Profile header (see core/profiling.py)
+    PROFILER_INTERVAL: float = 0.005    # 200 samples per second
+    PROFILE_MAX_SECONDS: float = 60
+    PROFILES_KEPT: int = 20
+
+    DATABASE_URL: str = "sqlite:///database.db"
+    ASYNC_DATABASE_URL: str = "sqlite+aiosqlite:///database.db"
+    DB_POOL_SIZE: int = 40          # Same as the Starlette threadpool, which runs the sync routes
+    DB_MAX_OVERFLOW: int = 10
+    # Count and time the queries of each request, log the slow ones and the probable N+1s (see core/db_profiling.py)
+    DB_PROFILING: bool = False
+    DB_SLOW_QUERY_SECONDS: float = 0.1
+    DB_N_PLUS_ONE_THRESHOLD: int = 10
+    SQLITE_PRAGMAS: dict[str, str | int] = {
+        "journal_mode": "WAL",      # Readers don't block the writer (and vice versa)
+        "synchronous": "NORMAL",    # Safe with WAL, fsync only on checkpoints
+        "mmap_size": 268435456,     # 256 MiB
+        "cache_size": -65536,       # Negative means KiB, so 64 MiB
+        "busy_timeout": 5000,       # ms to wait for a lock before "database is locked"
+        "foreign_keys": "ON",
+    }
 
 
 settings = Settings()
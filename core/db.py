@@ -1,22 +1,88 @@
+from sqlalchemy import Engine, event
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
 from sqlmodel import Session, create_engine, SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
 from fastapi import Depends
 from typing import Annotated
 
+from core.config import settings
+from core.db_profiling import query_profiler
 
-sqlite_file_name = "database.db"
-sqlite_url = f"sqlite:///{sqlite_file_name}"
 
-connect_args = {"check_same_thread": False}
-engine = create_engine(sqlite_url, connect_args=connect_args)
+def set_sqlite_pragmas(engine: Engine, pragmas: dict[str, str | int]):
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+def engine_kwargs(url: str, pool_size: int, max_overflow: int, **kwargs) -> dict:
+    if not url.startswith("sqlite"):
+        return {"pool_size": pool_size, "max_overflow": max_overflow, **kwargs}
+    kwargs["connect_args"] = {"check_same_thread": False, **kwargs.get("connect_args", {})}
+    if url.endswith(":memory:") or url.endswith("://"):
+        # In-memory databases live in a single connection, so there is no pool to size
+        return kwargs
+    return {"pool_size": pool_size, "max_overflow": max_overflow, **kwargs}
+
+
+def get_engine(
+        url: str = settings.DATABASE_URL,
+        pragmas: dict[str, str | int] | None = None,
+        pool_size: int = settings.DB_POOL_SIZE,
+        max_overflow: int = settings.DB_MAX_OVERFLOW,
+        **kwargs
+) -> Engine:
+    engine = create_engine(url, **engine_kwargs(url, pool_size, max_overflow, **kwargs))
+    if url.startswith("sqlite"):
+        set_sqlite_pragmas(engine, settings.SQLITE_PRAGMAS if pragmas is None else pragmas)
+    if settings.DB_PROFILING:
+        query_profiler.instrument(engine)
+    return engine
+
+
+def get_async_engine(
+        url: str = settings.ASYNC_DATABASE_URL,
+        pragmas: dict[str, str | int] | None = None,
+        pool_size: int = settings.DB_POOL_SIZE,
+        max_overflow: int = settings.DB_MAX_OVERFLOW,
+        **kwargs
+) -> AsyncEngine:
+    # Any SQLAlchemy async driver works here (sqlite+aiosqlite, postgresql+asyncpg, ...)
+    async_engine = create_async_engine(url, **engine_kwargs(url, pool_size, max_overflow, **kwargs))
+    if url.startswith("sqlite"):
+        set_sqlite_pragmas(async_engine.sync_engine, settings.SQLITE_PRAGMAS if pragmas is None else pragmas)
+    if settings.DB_PROFILING:
+        query_profiler.instrument(async_engine.sync_engine)
+    return async_engine
+
+
+engine = get_engine()
+async_engine = get_async_engine()
+async_session_maker = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
 
 
 def create_db_and_tables():
     SQLModel.metadata.create_all(engine)
 
 
-def get_session():
+async def get_session():
+    # Async so FastAPI closes the session on the event loop: it closes a sync generator in the
+    # threadpool, and under load the requests holding a connection while they wait for a thread
+    # starve the threads waiting for a connection. Creating the session doesn't connect, closing
+    # it hands the connection back to the pool.
     with Session(engine) as session:
         yield session
 
 
 SessionDep = Annotated[Session, Depends(get_session)]
+
+
+async def get_async_session():
+    async with async_session_maker() as session:
+        yield session
+
+
+AsyncSessionDep = Annotated[AsyncSession, Depends(get_async_session)]
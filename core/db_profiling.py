@@ -0,0 +1,90 @@
+import logging
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import lru_cache
+
+from sqlalchemy import Engine, event
+
+from core.config import settings
+
+
+logger = logging.getLogger(__name__)
+
+IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+
+@dataclass
+class QueryLog:
+    count: int = 0
+    duration: float = 0.0
+    shapes: Counter[str] = field(default_factory=Counter)
+
+
+# The queries of the request being processed. Starlette runs sync routes in threads that copy the
+# context and SQLAlchemy runs async sessions in greenlets that share it, so they all see this one
+current_queries: ContextVar[QueryLog | None] = ContextVar("current_queries", default=None)
+
+
+@lru_cache(maxsize=1024)
+def statement_shape(statement: str) -> str:
+    """The statement without its literals, and with its IN (?, ?, ...) lists of any length as IN (?)"""
+    return IN_LIST.sub("(?)", LITERAL.sub("?", " ".join(statement.split())))
+
+
+class QueryProfiler:
+    """
+    Times the queries of the engines it instruments. Each query is added to the QueryLog of the
+    current request, queries slower than slow_query_seconds are logged with their query plan, and
+    a request that runs the same statement shape n_plus_one_threshold times or more is logged as a
+    probable N+1: a query per row of a previous one, that a join or an IN would do at once.
+    """
+
+    def __init__(self, slow_query_seconds: float, n_plus_one_threshold: int):
+        self.slow_query_seconds = slow_query_seconds
+        self.n_plus_one_threshold = n_plus_one_threshold
+
+    def instrument(self, engine: Engine):
+        event.listen(engine, "before_cursor_execute", self.before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self.after_cursor_execute)
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start_times", []).append(time.perf_counter())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - conn.info["query_start_times"].pop()
+        log = current_queries.get()
+        if log is not None:
+            log.count += 1
+            log.duration += duration
+            log.shapes[statement_shape(statement)] += 1
+        if duration >= self.slow_query_seconds:
+            plan = "" if executemany else self.explain(conn, statement, parameters)
+            logger.warning("Slow query (%.3f s): %s %r%s", duration, statement, parameters, plan)
+
+    @staticmethod
+    def explain(conn, statement: str, parameters) -> str:
+        if conn.dialect.name != "sqlite" or not statement.lstrip().upper().startswith(("SELECT", "WITH", "UPDATE", "DELETE", "INSERT")):
+            return ""
+        try:
+            # A cursor of its own: the one of the query may still have rows to fetch
+            cursor = conn.connection.cursor()
+            try:
+                cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)
+                rows = cursor.fetchall()
+            finally:
+                cursor.close()
+        except Exception as exc:
+            return f"\n    (no query plan: {exc})"
+        return "".join(f"\n    {row[-1]}" for row in rows)
+
+    def report(self, log: QueryLog, request: str):
+        for shape, count in log.shapes.items():
+            if count >= self.n_plus_one_threshold:
+                logger.warning("Possible N+1 in %s, %d queries like: %s", request, count, shape)
+
+
+query_profiler = QueryProfiler(settings.DB_SLOW_QUERY_SECONDS, settings.DB_N_PLUS_ONE_THRESHOLD)
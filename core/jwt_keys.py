@@ -0,0 +1,152 @@
+import os
+import secrets
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+from jwt.algorithms import OKPAlgorithm, RSAAlgorithm
+
+from core.config import settings
+
+
+ASYMMETRIC_ALGORITHMS = {"RS256", "EdDSA"}
+
+
+@dataclass(frozen=True)
+class SigningKey:
+    kid: str
+    algorithm: str
+    created_at: float
+    private_key: Any
+    public_key: Any
+
+    def public_jwk(self) -> dict:
+        jwk_algorithm = RSAAlgorithm if self.algorithm == "RS256" else OKPAlgorithm
+        jwk = jwk_algorithm.to_jwk(self.public_key, as_dict=True)
+        return {**jwk, "kid": self.kid, "alg": self.algorithm, "use": "sig"}
+
+
+def generate_private_key(algorithm: str):
+    if algorithm == "RS256":
+        return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    if algorithm == "EdDSA":
+        return ed25519.Ed25519PrivateKey.generate()
+    raise ValueError(f"Unsupported asymmetric algorithm: {algorithm}")
+
+
+class KeySet:
+    """
+    Asymmetric JWT signing keys, saved as PEM files in key_dir (named <kid>.pem) so that all
+    the workers share them. The newest key signs, and every key younger than
+    rotation_interval + overlap still verifies, so tokens outlive the rotation of their key.
+
+    The PEM files are parsed once: tokens are verified with key objects cached by kid.
+    """
+
+    def __init__(self, algorithm: str, key_dir: str | os.PathLike, rotation_interval: float, overlap: float):
+        if algorithm not in ASYMMETRIC_ALGORITHMS:
+            raise ValueError(f"Unsupported asymmetric algorithm: {algorithm}")
+        self.algorithm = algorithm
+        self.key_dir = Path(key_dir)
+        self.rotation_interval = rotation_interval
+        self.overlap = overlap
+        self._keys: dict[str, SigningKey] = {}
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def load(self):
+        """(Re)load the key files, parsing only the ones not seen yet and forgetting retired keys"""
+        self.key_dir.mkdir(parents=True, exist_ok=True)
+        keys = {}
+        for path in self.key_dir.glob("*.pem"):
+            kid = path.stem
+            if kid in self._keys:
+                keys[kid] = self._keys[kid]
+                continue
+            try:
+                algorithm, created_at, _ = kid.split(".", 2)
+                float(created_at)
+            except ValueError:
+                continue    # Not one of our key files
+            private_key = serialization.load_pem_private_key(path.read_bytes(), password=None)
+            keys[kid] = SigningKey(kid, algorithm, float(created_at), private_key, private_key.public_key())
+        oldest_allowed = time.time() - self.rotation_interval - self.overlap
+        self._keys = {kid: key for kid, key in keys.items() if key.created_at >= oldest_allowed}
+        self._loaded_at = time.monotonic()
+
+    def rotate(self) -> SigningKey:
+        """Create a new signing key. The previous ones keep verifying until they retire"""
+        private_key = generate_private_key(self.algorithm)
+        created_at = int(time.time())
+        kid = f"{self.algorithm}.{created_at}.{secrets.token_hex(4)}"
+        pem = private_key.private_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PrivateFormat.PKCS8,
+            encryption_algorithm=serialization.NoEncryption(),
+        )
+        self.key_dir.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.key_dir / f"{kid}.pem", os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "wb") as file:
+            file.write(pem)
+        key = SigningKey(kid, self.algorithm, created_at, private_key, private_key.public_key())
+        self._keys[kid] = key
+        return key
+
+    def active_key(self) -> SigningKey:
+        with self._lock:
+            if not self._keys:
+                self.load()
+            candidates = [key for key in self._keys.values() if key.algorithm == self.algorithm]
+            newest = max(candidates, key=lambda key: key.created_at, default=None)
+            if newest is None or newest.created_at + self.rotation_interval <= time.time():
+                # Another worker may have rotated already: check the files before creating a key
+                self.load()
+                candidates = [key for key in self._keys.values() if key.algorithm == self.algorithm]
+                newest = max(candidates, key=lambda key: key.created_at, default=None)
+                if newest is None or newest.created_at + self.rotation_interval <= time.time():
+                    newest = self.rotate()
+            return newest
+
+    def verification_key(self, kid: str) -> SigningKey | None:
+        key = self._keys.get(kid)
+        if key is None and time.monotonic() - self._loaded_at > 1:
+            # Probably signed with a key another worker just created. At most one reload
+            # per second, so tokens with made-up kids can't make us hit the disk on every request
+            with self._lock:
+                self.load()
+                key = self._keys.get(kid)
+        return key
+
+    def encode(self, payload: dict) -> str:
+        key = self.active_key()
+        return jwt.encode(payload, key.private_key, algorithm=key.algorithm, headers={"kid": key.kid})
+
+    def decode(self, token: str) -> dict:
+        kid = jwt.get_unverified_header(token).get("kid")
+        key = self.verification_key(kid) if kid else None
+        if key is None:
+            raise jwt.InvalidTokenError("Unknown signing key")
+        return jwt.decode(token, key.public_key, algorithms=[key.algorithm])
+
+    def jwks(self) -> dict:
+        self.active_key()
+        return {"keys": [key.public_jwk() for key in sorted(self._keys.values(), key=lambda key: key.created_at)]}
+
+
+def get_key_set() -> KeySet | None:
+    if settings.JWT_ALGORITHM not in ASYMMETRIC_ALGORITHMS:
+        return None
+    return KeySet(
+        algorithm=settings.JWT_ALGORITHM,
+        key_dir=settings.JWT_KEY_DIR,
+        rotation_interval=settings.JWT_KEY_ROTATION_DAYS * 24 * 3600,
+        overlap=settings.JWT_KEY_OVERLAP_MINUTES * 60,
+    )
+
+
+key_set = get_key_set()
@@ -0,0 +1,171 @@
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from collections import defaultdict
+
+
+# Latencies in seconds and sizes in bytes, the usual Prometheus client defaults for the first
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000)
+# Anything else a client sends as its method is counted as OTHER, so it can't add series
+HTTP_METHODS = frozenset({"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS", "TRACE", "CONNECT"})
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{escape_label(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def format_number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metric(ABC):
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+
+    @abstractmethod
+    def samples(self) -> list[str]:
+        """The exposition lines of the metric's series, without the HELP and TYPE lines"""
+        ...
+
+    def render(self) -> str:
+        return "\n".join([
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+            *self.samples(),
+        ])
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.values: defaultdict[tuple, float] = defaultdict(float)
+
+    def inc(self, labels: tuple = (), amount: float = 1):
+        self.values[labels] += amount
+
+    def samples(self) -> list[str]:
+        return [
+            f"{self.name}{format_labels(self.labelnames, labels)} {format_number(value)}"
+            for labels, value in list(self.values.items())
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, labels: tuple = (), amount: float = 1):
+        self.values[labels] -= amount
+
+
+class Histogram(Metric):
+    """
+    Counts per bucket are kept non-cumulative, so an observation is a bisect and two additions:
+    the cumulative counts Prometheus wants are only computed when /metrics is scraped.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.counts: dict[tuple, list[int]] = {}
+        self.sums: defaultdict[tuple, float] = defaultdict(float)
+
+    def observe(self, labels: tuple, value: float):
+        counts = self.counts.get(labels)
+        if counts is None:
+            counts = self.counts[labels] = [0] * (len(self.buckets) + 1)     # The last one is +Inf
+        counts[bisect_left(self.buckets, value)] += 1
+        self.sums[labels] += value
+
+    def samples(self) -> list[str]:
+        lines = []
+        for labels, counts in list(self.counts.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                le = f'le="{format_number(bound)}"'
+                lines.append(f"{self.name}_bucket{format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labelnames, labels)} {format_number(self.sums[labels])}")
+            lines.append(f"{self.name}_count{format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: list[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """All the metrics in the Prometheus text exposition format"""
+        return "\n".join(metric.render() for metric in self.metrics) + "\n"
+
+
+class HTTPMetrics:
+    """
+    Request metrics, labelled by the route template (/heroes/{hero_id}, not /heroes/42) so the
+    number of series stays bounded. Requests that match no route share the route label "", and
+    the ones with a method that isn't standard the method label "OTHER".
+
+    They are only updated from the event loop, so they need no lock. Each worker process has
+    its own: Prometheus scrapes them one by one, or a single worker serves them all.
+    """
+
+    def __init__(self, registry: MetricsRegistry):
+        self.in_progress = registry.register(Gauge(
+            "http_requests_in_progress", "HTTP requests being processed", ("method",)
+        ))
+        self.requests = registry.register(Counter(
+            "http_requests_total", "HTTP requests by route and status code", ("method", "route", "status")
+        ))
+        self.latency = registry.register(Histogram(
+            "http_request_duration_seconds", "HTTP request latency", ("method", "route")
+        ))
+        self.request_size = registry.register(Histogram(
+            "http_request_size_bytes", "HTTP request body size", ("method", "route"), SIZE_BUCKETS
+        ))
+        self.response_size = registry.register(Histogram(
+            "http_response_size_bytes", "HTTP response body size", ("method", "route"), SIZE_BUCKETS
+        ))
+
+    @staticmethod
+    def method_label(method: str) -> str:
+        return method if method in HTTP_METHODS else "OTHER"
+
+    def start(self, method: str):
+        self.in_progress.values[(self.method_label(method),)] += 1
+
+    def finish(self, method: str, route: str, status_code: int, duration: float,
+               request_size: int | None, response_size: int | None):
+        method = self.method_label(method)
+        self.in_progress.values[(method,)] -= 1
+        labels = (method, route)
+        self.requests.values[(method, route, status_code)] += 1
+        self.latency.observe(labels, duration)
+        if request_size is not None:
+            self.request_size.observe(labels, request_size)
+        if response_size is not None:
+            self.response_size.observe(labels, response_size)
+
+
+registry = MetricsRegistry()
+http_metrics = HTTPMetrics(registry)
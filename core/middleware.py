@@ -0,0 +1,197 @@
+import time
+from typing import Collection
+
+from starlette.middleware.cors import CORSMiddleware
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from core.api_keys import ApiKeyRegistry
+from core.db_profiling import QueryLog, QueryProfiler, current_queries
+from core.metrics import HTTPMetrics
+from core.profiling import SamplingProfiler
+
+
+class ProcessTimeMiddleware:
+    """
+    Pure ASGI middleware that adds X-Process-Time (seconds until the response headers) to every
+    HTTP response and records the request in HTTPMetrics. Unlike @app.middleware("http"), it
+    doesn't run the app in another task nor pipe the response through a memory stream, so it
+    costs a couple of function calls per message and streaming responses still stream.
+    """
+
+    def __init__(self, app: ASGIApp, metrics: HTTPMetrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        self.metrics.start(method)
+        start_time = time.perf_counter()
+        status_code = 500
+        response_size = 0
+        response_headers = []
+
+        async def send_timed(message: Message):
+            nonlocal status_code, response_size, response_headers
+            message_type = message["type"]
+            if message_type == "http.response.start":
+                status_code = message["status"]
+                process_time = str(time.perf_counter() - start_time).encode()
+                # A new list: the one in the message may belong to a response object that is reused
+                response_headers = [*message.get("headers", ()), (b"x-process-time", process_time)]
+                message = {**message, "headers": response_headers}
+            elif message_type == "http.response.body":
+                response_size += len(message.get("body", b""))
+            elif message_type == "http.response.pathsend":
+                response_size += int(header_value(response_headers, b"content-length") or 0)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_timed)
+        finally:
+            route = scope.get("route")
+            request_size = header_value(scope["headers"], b"content-length")
+            self.metrics.finish(
+                method,
+                route.path if route else "",
+                status_code,
+                time.perf_counter() - start_time,
+                int(request_size) if request_size and request_size.isdigit() else None,
+                response_size,
+            )
+
+
+class QueryProfilingMiddleware:
+    """
+    Gives each HTTP request a QueryLog for the QueryProfiler to fill and reports its probable N+1s
+    once it is done. With add_headers, the responses tell the number of queries (X-DB-Queries) and
+    their total time in seconds (X-DB-Time) run until the response headers were sent.
+    """
+
+    def __init__(self, app: ASGIApp, profiler: QueryProfiler, add_headers: bool = False):
+        self.app = app
+        self.profiler = profiler
+        self.add_headers = add_headers
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        log = QueryLog()
+        token = current_queries.set(log)
+
+        async def send_with_queries(message: Message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [
+                    *message.get("headers", ()),
+                    (b"x-db-queries", str(log.count).encode()),
+                    (b"x-db-time", str(log.duration).encode()),
+                ]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_queries if self.add_headers else send)
+        finally:
+            current_queries.reset(token)
+            route = scope.get("route")
+            self.profiler.report(log, f"{scope['method']} {route.path if route else scope['path']}")
+
+
+class RequestProfilingMiddleware:
+    """
+    Profiles the requests whose X-Profile header holds an API key with all the scopes, the
+    other ones cost a header lookup. The response tells the id of the profile (X-Profile-Id)
+    to fetch it from /admin/profiles/{profile_id} once the request is done. The profiler samples
+    the whole process, so what concurrent requests run shows up too.
+    """
+
+    def __init__(self, app: ASGIApp, profiler: SamplingProfiler, api_keys: ApiKeyRegistry, scopes: frozenset[str]):
+        self.app = app
+        self.profiler = profiler
+        self.api_keys = api_keys
+        self.scopes = scopes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        key = header_value(scope["headers"], b"x-profile") if scope["type"] == "http" else None
+        if key is None or await self.api_keys.verify_async(key.decode("latin-1"), self.scopes) is None:
+            await self.app(scope, receive, send)
+            return
+
+        session = self.profiler.start()
+
+        async def send_with_profile_id(message: Message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", ()), (b"x-profile-id", str(session.id).encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            self.profiler.stop(session)
+
+
+def header_value(headers, name: bytes) -> bytes | None:
+    for key, value in headers:
+        if key == name:
+            return value
+    return None
+
+
+class FastCORSMiddleware(CORSMiddleware):
+    """
+    CORSMiddleware that answers the preflights of a fixed list of origins from headers prepared
+    once per origin, without building a Headers object nor a Response for each of them. Anything
+    else (other origins, restricted methods or headers, private network requests...) is left to
+    CORSMiddleware, which gives the same answer, only slower.
+    """
+
+    def __init__(self, app: ASGIApp, allow_origins: Collection[str] = (), **kwargs):
+        super().__init__(app, allow_origins=allow_origins, **kwargs)
+        self.preflight_by_origin: dict[bytes, list[tuple[bytes, bytes]]] = {}
+        if self.allow_all_origins or self.allow_origin_regex is not None:
+            return
+        for origin in allow_origins:
+            headers = {**self.preflight_headers, "Access-Control-Allow-Origin": origin}
+            self.preflight_by_origin[origin.encode("latin-1")] = [
+                (name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers.items()
+            ]
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "http" and scope["method"] == "OPTIONS" and self.preflight_by_origin:
+            origin = requested_method = requested_headers = None
+            for name, value in scope["headers"]:
+                if name == b"origin":
+                    origin = origin or value
+                elif name == b"access-control-request-method":
+                    requested_method = requested_method or value
+                elif name == b"access-control-request-headers":
+                    requested_headers = requested_headers or value
+                elif name == b"access-control-request-private-network":
+                    break   # Rare, let CORSMiddleware handle it
+            else:
+                headers = self.preflight_by_origin.get(origin)
+                if (
+                        headers is not None
+                        and requested_method is not None
+                        and requested_method.decode("latin-1") in self.allow_methods
+                        and (requested_headers is None or self.allow_all_headers)
+                ):
+                    await self.send_preflight(send, headers, requested_headers)
+                    return
+        await super().__call__(scope, receive, send)
+
+    @staticmethod
+    async def send_preflight(send: Send, headers: list[tuple[bytes, bytes]], requested_headers: bytes | None):
+        if requested_headers is not None:
+            # All headers are allowed: mirror the requested ones, like CORSMiddleware
+            headers = [*headers, (b"access-control-allow-headers", requested_headers)]
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [*headers, (b"content-length", b"2"), (b"content-type", b"text/plain; charset=utf-8")],
+        })
+        await send({"type": "http.response.body", "body": b"OK"})
@@ -0,0 +1,41 @@
+import base64
+import json
+from typing import Any, Generic, TypeVar
+
+from fastapi import HTTPException, status
+from pydantic import BaseModel
+
+
+T = TypeVar("T")
+
+
+class Page(BaseModel, Generic[T]):
+    data: list[T]
+    next_cursor: str | None = None
+
+
+def encode_cursor(order_by: str, value: Any, last_id: int) -> str:
+    # The cursor is opaque to clients: it only carries the sort key of the last row
+    # returned, so the next page can start right after it using the index (keyset pagination)
+    raw = json.dumps({"o": order_by, "v": value, "id": last_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def is_sort_value(value: Any) -> bool:
+    # What encode_cursor() puts in a cursor: a str or an int column value, in SQLite's 64-bit range
+    if isinstance(value, bool):
+        return False
+    return isinstance(value, str) or (isinstance(value, int) and -2 ** 63 <= value < 2 ** 63)
+
+
+def decode_cursor(cursor: str, order_by: str) -> tuple[Any, int]:
+    invalid_cursor = HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        value, last_id = payload["v"], payload["id"]
+        if payload["o"] != order_by or not is_sort_value(value) or not (is_sort_value(last_id) and isinstance(last_id, int)):
+            raise invalid_cursor
+        return value, last_id
+    except (ValueError, KeyError, TypeError):
+        raise invalid_cursor
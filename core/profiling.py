@@ -0,0 +1,134 @@
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+from types import CodeType
+
+from core.config import settings
+
+
+# The scope of the API keys allowed to profile the app
+PROFILING_SCOPE = "profiling"
+
+# Leaf frames of threads waiting for work rather than doing any: the event loop polling its
+# sockets, executor and AnyIO worker threads waiting on their queues, and with uvloop, whose loop
+# has no Python frames, the asyncio runner
+IDLE_FRAMES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+    ("_asyncio.py", "run"),
+    ("runners.py", "run"),
+}
+
+
+class ProfileSession:
+    def __init__(self, id: int, max_seconds: float):
+        self.id = id
+        self.started_at = time.monotonic()
+        self.deadline = self.started_at + max_seconds
+        self.duration: float | None = None  # Set once it is stopped
+        self.samples = 0
+        self.stacks: Counter[tuple[str, bool]] = Counter()     # (stack, idle) -> samples
+
+    def collapsed(self, idle: bool = False) -> str:
+        """The stacks in the collapsed format of flamegraph.pl, speedscope...: one "a;b;c count" line each"""
+        return "".join(
+            f"{stack} {count}\n" for (stack, is_idle), count in self.stacks.most_common() if idle or not is_idle
+        )
+
+
+class SamplingProfiler:
+    """
+    Sampling profiler for the live process: while a session is running, a thread of its own
+    takes the Python stack of every other thread each interval seconds, so the profiled code
+    runs untouched and the overhead stays the same however hot it is. Stacks are rooted at the
+    name of their thread (MainThread runs the event loop, AnyIO workers the sync routes).
+
+    Sessions may overlap, they share the samples taken while they both run. The finished ones
+    are kept, up to max_kept of them, for get().
+    """
+
+    def __init__(self, interval: float, max_seconds: float, max_kept: int):
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.max_kept = max_kept
+        self._running: dict[int, ProfileSession] = {}
+        self._finished: OrderedDict[int, ProfileSession] = OrderedDict()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._labels: dict[CodeType, str] = {}     # Only used by the sampling thread
+
+    def start(self, max_seconds: float | None = None) -> ProfileSession:
+        """Start a session, stopped by stop() or after max_seconds, at most self.max_seconds"""
+        max_seconds = self.max_seconds if max_seconds is None else min(max_seconds, self.max_seconds)
+        with self._lock:
+            session = ProfileSession(next(self._ids), max_seconds)
+            self._running[session.id] = session
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+                self._thread.start()
+        return session
+
+    def stop(self, session: ProfileSession) -> ProfileSession:
+        with self._lock:
+            if self._running.pop(session.id, None) is not None:
+                self._finish(session)
+        return session
+
+    def get(self, id: int) -> ProfileSession | None:
+        with self._lock:
+            return self._running.get(id) or self._finished.get(id)
+
+    def _finish(self, session: ProfileSession):
+        session.duration = time.monotonic() - session.started_at
+        self._finished[session.id] = session
+        while len(self._finished) > self.max_kept:
+            self._finished.popitem(last=False)
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while True:
+            started = time.monotonic()
+            with self._lock:
+                for session in [session for session in self._running.values() if session.deadline <= started]:
+                    del self._running[session.id]
+                    self._finish(session)
+                if not self._running:
+                    self._thread = None
+                    return
+            stacks = self.sample(own_id)
+            with self._lock:
+                for session in self._running.values():
+                    session.samples += 1
+                    session.stacks.update(stacks)
+            time.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def sample(self, skip_thread_id: int) -> list[tuple[str, bool]]:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        stacks = []
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == skip_thread_id:
+                continue
+            code = frame.f_code
+            idle = (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES
+            labels = []
+            while frame is not None:
+                labels.append(self._labels.get(frame.f_code) or self.label(frame.f_code))
+                frame = frame.f_back
+            labels.append(names.get(thread_id, str(thread_id)))
+            stacks.append((";".join(reversed(labels)), idle))
+        return stacks
+
+    def label(self, code: CodeType) -> str:
+        # By function, not by line, so a function is a single box of the flamegraph
+        label = f"{getattr(code, 'co_qualname', code.co_name)} ({code.co_filename}:{code.co_firstlineno})"
+        self._labels[code] = label.replace(";", ":")
+        return self._labels[code]
+
+
+profiler = SamplingProfiler(settings.PROFILER_INTERVAL, settings.PROFILE_MAX_SECONDS, settings.PROFILES_KEPT)
@@ -0,0 +1,115 @@
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+from fastapi import HTTPException, Request, status
+from pydantic import BaseModel
+
+
+class RateLimitStats(BaseModel):
+    allowed: int = 0
+    rejected: int = 0
+    evictions: int = 0
+    keys: int = 0
+    throttled_keys: int = 0     # Keys without a token left right now
+    max_keys: int | None = None
+
+
+class RateLimitBackend(ABC):
+    """Token buckets by key: each bucket holds up to capacity tokens and refills at rate tokens per second"""
+
+    @abstractmethod
+    def take(self, key: str, capacity: float, rate: float, cost: float = 1) -> float:
+        """Take cost tokens from the bucket of key. Returns 0 if it had them, else the seconds until it will"""
+        ...
+
+    @abstractmethod
+    def stats(self) -> RateLimitStats:
+        ...
+
+
+class MemoryRateLimitBackend(RateLimitBackend):
+    """
+    Buckets in an in-process LRU, bounded by max_keys. A bucket is only two floats updated when
+    it is used, with the refill computed from the elapsed time, so idle keys cost no work.
+    Evicting a bucket refills it, so keep max_keys well above the keys active in a refill period.
+    """
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, tuple[float, float, float, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = RateLimitStats(max_keys=max_keys)
+
+    def take(self, key: str, capacity: float, rate: float, cost: float = 1) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at, _, _ = self._buckets.get(key, (capacity, now, capacity, rate))
+            tokens = min(capacity, tokens + (now - updated_at) * rate)
+            if tokens >= cost:
+                tokens -= cost
+                retry_after = 0.0
+                self._stats.allowed += 1
+            else:
+                retry_after = (cost - tokens) / rate
+                self._stats.rejected += 1
+            self._buckets[key] = (tokens, now, capacity, rate)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+                self._stats.evictions += 1
+            return retry_after
+
+    def stats(self) -> RateLimitStats:
+        now = time.monotonic()
+        with self._lock:
+            throttled = sum(
+                1 for tokens, updated_at, capacity, rate in self._buckets.values()
+                if min(capacity, tokens + (now - updated_at) * rate) < 1
+            )
+            return self._stats.model_copy(update={"keys": len(self._buckets), "throttled_keys": throttled})
+
+
+class RateLimiter:
+    """
+    Dependency that spends a token from the bucket of the client IP and, for form requests with a
+    username field, from the bucket of that username. Limits are (burst, seconds to refill it), None
+    disables one. Dependencies run before the endpoint, so a rejected request costs no hashing.
+
+    The IP is the one of the connection: run uvicorn with --proxy-headers behind a trusted proxy,
+    a client can put anything in X-Forwarded-For.
+    """
+
+    def __init__(self, backend: RateLimitBackend, name: str,
+                 per_ip: tuple[int, float] | None = None, per_username: tuple[int, float] | None = None):
+        self.backend = backend
+        self.name = name
+        self.per_ip = per_ip
+        self.per_username = per_username
+
+    async def keys(self, request: Request) -> list[tuple[str, tuple[int, float]]]:
+        keys = []
+        if self.per_ip:
+            host = request.client.host if request.client else "unknown"
+            keys.append((f"{self.name}:ip:{host}", self.per_ip))
+        if self.per_username:
+            # FastAPI parsed the form before the dependencies run, so this is the cached one
+            username = (await request.form()).get("username")
+            if isinstance(username, str):
+                keys.append((f"{self.name}:username:{username}", self.per_username))
+        return keys
+
+    async def __call__(self, request: Request):
+        for key, (capacity, period) in await self.keys(request):
+            retry_after = self.backend.take(key, capacity, capacity / period)
+            if retry_after:
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail="Too many attempts, try again later",
+                    headers={"Retry-After": str(math.ceil(retry_after))},
+                )
+
+    def stats(self) -> RateLimitStats:
+        return self.backend.stats()
@@ -0,0 +1,216 @@
+import mmap
+import os
+import re
+import secrets
+from email.utils import formatdate, parsedate_to_datetime
+from mimetypes import guess_type
+from typing import Any, Mapping
+
+import orjson
+from fastapi import HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from pydantic_core import to_jsonable_python
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from core.routing import etag_matches
+
+
+MAX_RANGES = 16
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response rendered by orjson, which handles dicts, lists, datetimes, UUIDs and dataclasses
+    natively. What it doesn't know (pydantic models, timedeltas, sets...) goes through pydantic-core,
+    and UTC datetimes end in Z, so the bytes are the same as FastAPI's pydantic serialization gives.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=to_jsonable_python, option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS)
+
+
+RANGE_SPEC = re.compile(r"(\d*)-(\d*)")
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range_spec(spec: str, file_size: int) -> tuple[int, int]:
+    """The half-open interval of a range-spec like 0-99, 100- or -100, empty if it is past the end"""
+    match = RANGE_SPEC.fullmatch(spec)
+    if match is None or match.groups() == ("", ""):
+        raise ValueError(f"Invalid range: {spec}")
+    start_text, end_text = match.groups()
+    if not start_text:     # Suffix range: the last N bytes
+        return max(file_size - int(end_text), 0), file_size
+    if end_text and int(end_text) < int(start_text):
+        raise ValueError(f"Invalid range: {spec}")
+    start = int(start_text)
+    return start, max(start, min(int(end_text) + 1, file_size) if end_text else file_size)
+
+
+def parse_ranges(range_header: str, file_size: int) -> list[tuple[int, int]] | None:
+    """
+    Parse a `bytes=` Range header into sorted, merged, half-open (start, end) intervals. Return None
+    for a header to ignore (another unit, invalid syntax, too many ranges), which gets the whole file,
+    and raise RangeNotSatisfiable when it is valid but none of its ranges overlaps the file.
+    """
+    unit, _, ranges_spec = range_header.partition("=")
+    specs = [spec.strip() for spec in ranges_spec.split(",") if spec.strip()]
+    if unit.strip().lower() != "bytes" or not specs:
+        return None
+    try:
+        ranges = [(start, end) for start, end in (parse_range_spec(spec, file_size) for spec in specs) if start < end]
+    except ValueError:
+        return None
+    if not ranges:
+        raise RangeNotSatisfiable
+
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        if start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged if len(merged) <= MAX_RANGES else None
+
+
+class RangeFileResponse(Response):
+    """
+    Serves a file with HTTP Range support (single and multiple ranges), and 304 Not Modified
+    without a body when If-None-Match (or, without it, If-Modified-Since) says the client's copy
+    is current.
+
+    If the server supports the `http.response.pathsend` ASGI extension, whole files are handed to
+    it so it can send them with sendfile. Otherwise the file is memory-mapped and sent in slices of
+    the mapping, without reading it into intermediate buffers or hopping to a thread per chunk.
+    """
+
+    chunk_size = 1024 * 1024
+
+    def __init__(
+            self,
+            path: str | os.PathLike,
+            media_type: str | None = None,
+            headers: Mapping[str, str] | None = None,
+            stat_result: os.stat_result | None = None,
+            status_code: int = status.HTTP_200_OK,
+    ):
+        self.path = path
+        self.status_code = status_code
+        self.background = None
+        self.media_type = media_type or guess_type(str(path))[0] or "application/octet-stream"
+        self.init_headers(headers)
+        stat_result = stat_result or os.stat(path)
+        self.file_size = stat_result.st_size
+        self.mtime = int(stat_result.st_mtime)
+        self.headers.setdefault("accept-ranges", "bytes")
+        self.headers.setdefault("last-modified", formatdate(stat_result.st_mtime, usegmt=True))
+        self.headers.setdefault("etag", f'"{int(stat_result.st_mtime_ns):x}-{self.file_size:x}"')
+        self.headers["content-length"] = str(self.file_size)
+
+    def not_modified(self, request_headers: Headers) -> bool:
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match:
+            return etag_matches(self.headers["etag"], if_none_match)
+        if_modified_since = request_headers.get("if-modified-since")
+        if not if_modified_since:
+            return False
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):     # Invalid dates are ignored
+            return False
+        return self.mtime <= since
+
+    def requested_ranges(self, request_headers: Headers) -> list[tuple[int, int]] | None:
+        range_header = request_headers.get("range")
+        if not range_header:
+            return None
+        if_range = request_headers.get("if-range")
+        if if_range and if_range not in (self.headers["etag"], self.headers["last-modified"]):
+            return None     # The client's copy is outdated: send the whole file
+        try:
+            return parse_ranges(range_header, self.file_size)
+        except RangeNotSatisfiable:
+            raise HTTPException(
+                status_code=status.HTTP_416_RANGE_NOT_SATISFIABLE,
+                headers={"content-range": f"bytes */{self.file_size}"},
+            )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        request_headers = Headers(scope=scope)
+        if self.not_modified(request_headers):
+            headers = [(name, value) for name, value in self.raw_headers if name not in (b"content-length", b"content-type")]
+            await send({"type": "http.response.start", "status": status.HTTP_304_NOT_MODIFIED, "headers": headers})
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        ranges = self.requested_ranges(request_headers)
+        header_only = scope["method"].upper() == "HEAD"
+        boundary = secrets.token_hex(16)
+        if ranges is not None:
+            self.status_code = status.HTTP_206_PARTIAL_CONTENT
+            if len(ranges) == 1:
+                start, end = ranges[0]
+                self.headers["content-range"] = f"bytes {start}-{end - 1}/{self.file_size}"
+                self.headers["content-length"] = str(end - start)
+            else:
+                parts = self.multipart_headers(ranges, boundary)
+                self.headers["content-type"] = f"multipart/byteranges; boundary={boundary}"
+                self.headers["content-length"] = str(
+                    sum(len(part) + end - start + 2 for part, (start, end) in zip(parts, ranges))
+                    + len(f"--{boundary}--\r\n")
+                )
+
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if header_only or self.file_size == 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        elif ranges is None and "http.response.pathsend" in scope.get("extensions", {}):
+            await send({"type": "http.response.pathsend", "path": os.fspath(self.path)})
+        else:
+            await self.send_mapped(send, ranges, boundary)
+
+    def multipart_headers(self, ranges: list[tuple[int, int]], boundary: str) -> list[bytes]:
+        return [
+            (
+                f"--{boundary}\r\n"
+                f"content-type: {self.media_type}\r\n"
+                f"content-range: bytes {start}-{end - 1}/{self.file_size}\r\n\r\n"
+            ).encode("latin-1")
+            for start, end in ranges
+        ]
+
+    async def send_mapped(self, send: Send, ranges: list[tuple[int, int]] | None, boundary: str):
+        def open_mapping():
+            with open(self.path, "rb") as file:
+                return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        mapped = await run_in_threadpool(open_mapping)
+        try:
+            with memoryview(mapped) as view:
+                await self.send_views(send, view, ranges, boundary)
+        finally:
+            mapped.close()
+
+    async def send_views(self, send: Send, view: memoryview, ranges: list[tuple[int, int]] | None, boundary: str):
+        if ranges is None:
+            await self.send_slices(send, view, 0, self.file_size, last=True)
+        elif len(ranges) == 1:
+            await self.send_slices(send, view, *ranges[0], last=True)
+        else:
+            for part, (start, end) in zip(self.multipart_headers(ranges, boundary), ranges):
+                await send({"type": "http.response.body", "body": part, "more_body": True})
+                await self.send_slices(send, view, start, end, last=False)
+                await send({"type": "http.response.body", "body": b"\r\n", "more_body": True})
+            await send({"type": "http.response.body", "body": f"--{boundary}--\r\n".encode(), "more_body": False})
+
+    async def send_slices(self, send: Send, view: memoryview, start: int, end: int, last: bool):
+        while start < end:
+            stop = min(start + self.chunk_size, end)
+            # ASGI servers expect bytes, so this is the only copy: straight from the page cache
+            await send({"type": "http.response.body", "body": bytes(view[start:stop]), "more_body": stop < end or not last})
+            start = stop
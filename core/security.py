@@ -1,18 +1,31 @@
-from typing import Annotated
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Annotated, Any
 from fastapi import Cookie, Depends, HTTPException, Header
 from fastapi.security import OAuth2PasswordBearer
+import jwt
+from passlib.context import CryptContext
 from pydantic import BaseModel
 
+from core.api_keys import ApiKey, ApiKeyRegistry
+from core.config import settings
+from core.db import engine
+from core.jwt_keys import key_set
+from core.workers import BoundedPool
+
 
 # to get a string like this run:
 # openssl rand -hex 32
 SECRET_KEY = "09d25e094faa6ca2556c818166b7a9563b93f7099f6f0f4caa6cf63b88e8d3e7"
-ALGORITHM = "HS256"
+ALGORITHM = "HS256"     # Only used when settings.JWT_ALGORITHM is HS256
 
 
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: str | None = None
 
 
 class TokenData(BaseModel):
@@ -50,15 +63,147 @@ def fake_password_hasher(raw_password: str):
     return "supersecret" + raw_password
 
 
+def get_password_context(
+        schemes: list[str] = settings.PASSWORD_SCHEMES,
+        scheme_settings: dict[str, str | int] = settings.PASSWORD_SCHEME_SETTINGS
+) -> CryptContext:
+    # deprecated="auto" marks every scheme but the first as outdated, and so are hashes
+    # with other costs than the configured ones: needs_update() is True for both
+    return CryptContext(schemes=schemes, deprecated="auto", **scheme_settings)
+
+
+pwd_context = get_password_context()
+
+# A hash or verification takes hundreds of ms of CPU, so it runs here and never on the event loop
+password_pool = BoundedPool(
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    max_queue=settings.PASSWORD_HASH_QUEUE,
+    name="password",
+    nice=settings.PASSWORD_HASH_NICE,
+)
+
+
+def verify_password(plain_password, hashed_password):
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def verify_and_update_password(plain_password, hashed_password) -> tuple[bool, str | None]:
+    """Verify the password and, if its hash uses an outdated scheme or cost, also return a new hash for it"""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+def get_password_hash(password):
+    return pwd_context.hash(password)
+
+
+api_key_registry = ApiKeyRegistry(
+    engine,
+    prefix_length=settings.API_KEY_PREFIX_LENGTH,
+    max_entries=settings.API_KEY_CACHE_MAX_ENTRIES,
+    ttl=settings.API_KEY_CACHE_TTL,
+    max_missing=settings.API_KEY_MISSING_CACHE_MAX_ENTRIES,
+)
+
+# The keys the examples use, registered on startup
+default_api_keys = [
+    ("fake-super-secret-token", "Example X-Token", ["items"]),
+    ("fake-super-secret-key", "Example X-Key", ["items", "api-keys"]),
+]
+
+
+def create_default_api_keys():
+    api_key_registry.add_missing(default_api_keys)
+
+
 async def verify_token(x_token: Annotated[str, Header()]):
-    if x_token != "fake-super-secret-token":
+    if await api_key_registry.verify_async(x_token, {"items"}) is None:
         raise HTTPException(status_code=400, detail="X-Token header invalid")
 
 
 async def verify_key(x_key: Annotated[str, Header()]):
-    if x_key != "fake-super-secret-key":
+    if await api_key_registry.verify_async(x_key, {"items"}) is None:
         raise HTTPException(status_code=400, detail="X-Key header invalid")
     return x_key
 
 
+class RequireScopes:
+    """Dependency accepting only an X-Key with all these scopes"""
+
+    def __init__(self, *scopes: str):
+        self.scopes = frozenset(scopes)
+
+    async def __call__(self, x_key: Annotated[str, Header()]) -> ApiKey:
+        api_key = await api_key_registry.verify_async(x_key, self.scopes)
+        if api_key is None:
+            raise HTTPException(status_code=403, detail="X-Key header invalid or missing a scope")
+        return api_key
+
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+
+
+def encode_token(payload: dict) -> str:
+    if key_set:
+        return key_set.encode(payload)
+    return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
+
+
+def decode_token(token: str) -> dict:
+    """Verify the token and return its payload (raises jwt.InvalidTokenError)"""
+    if key_set:
+        return key_set.decode(token)
+    return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+
+class VerifiedTokenCache:
+    """
+    Bounded LRU of tokens that were already verified, keyed by the token's SHA-256 (the token
+    itself is never kept), holding the user it resolved to. An entry never outlives the token's
+    exp, nor max_ttl, so changes to a user show up even if nobody calls invalidate_user().
+    """
+
+    def __init__(self, max_entries: int, max_ttl: float):
+        self.max_entries = max_entries
+        self.max_ttl = max_ttl
+        self._entries: OrderedDict[bytes, tuple[Any, str, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> Any | None:
+        key = self.key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            user, _, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return user
+
+    def set(self, token: str, user: Any, username: str, exp: float):
+        key = self.key(token)
+        expires_at = min(exp, time.time() + self.max_ttl)
+        with self._lock:
+            self._entries[key] = (user, username, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, token: str):
+        with self._lock:
+            self._entries.pop(self.key(token), None)
+
+    def invalidate_user(self, username: str):
+        # Rare (a user was disabled or changed), so a scan beats keeping a second index up to date
+        with self._lock:
+            for key in [key for key, (_, name, _) in self._entries.items() if name == username]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,73 @@
+import os
+import re
+from functools import lru_cache
+from pathlib import Path
+
+from core.config import settings
+from core.uploads import SNIFF_SIZE, FileReport, SpoolSink, StreamedFile, check_upload_size, sniff_content_type
+
+
+SHA256_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+class ContentStore:
+    """
+    Content-addressed blob store: every file is saved under its SHA-256, sharded in two levels
+    of directories (ab/cd/abcd...), so identical uploads are stored only once.
+    """
+
+    def __init__(self, root: str | os.PathLike):
+        self.root = Path(root)
+        self.tmp = self.root / "tmp"
+        self.tmp.mkdir(parents=True, exist_ok=True)
+
+    def path(self, digest: str) -> Path:
+        if not SHA256_PATTERN.match(digest):
+            raise ValueError(f"Invalid SHA-256 digest: {digest!r}")
+        return self.root / digest[:2] / digest[2:4] / digest
+
+    def exists(self, digest: str) -> bool:
+        return self.path(digest).is_file()
+
+    def commit(self, temp_path: str | os.PathLike, digest: str) -> bool:
+        """Move a fully written temporary file to its place. Returns False if the content was already stored."""
+        path = self.path(digest)
+        if path.is_file():
+            os.remove(temp_path)
+            return False
+        path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(temp_path, path)     # Atomic, so readers never see a partial blob
+        return True
+
+    def sink(self, field_name: str, filename: str | None = None, content_type: str | None = None) -> SpoolSink:
+        return SpoolSink(field_name, filename, content_type, directory=str(self.tmp))
+
+    def discard(self, files: list[StreamedFile]):
+        """Remove spooled files that won't be stored (e.g. sent in unexpected form fields)"""
+        for file in files:
+            if file.path and os.path.exists(file.path):
+                os.remove(file.path)
+
+    def store(self, file: StreamedFile) -> FileReport:
+        """Check, sniff and commit a file spooled by one of this store's sinks (blocking, run it in a thread)"""
+        try:
+            check_upload_size(file.size)
+            with open(file.path, "rb") as spooled:
+                content_type = sniff_content_type(spooled.read(SNIFF_SIZE), file.content_type)
+            stored = self.commit(file.path, file.sha256)
+        except BaseException:
+            if os.path.exists(file.path):
+                os.remove(file.path)
+            raise
+        return FileReport(
+            index=0,
+            size=file.size,
+            sha256=file.sha256,
+            content_type=content_type,
+            duplicate=not stored,
+        )
+
+
+@lru_cache
+def get_content_store() -> ContentStore:
+    return ContentStore(settings.UPLOAD_STORE_DIR)
@@ -0,0 +1,273 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Sequence
+
+from fastapi import HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel
+from python_multipart.exceptions import FormParserError
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+from core.config import settings
+
+
+class StreamedFile(BaseModel):
+    field_name: str
+    filename: str | None = None
+    content_type: str | None = None
+    size: int
+    sha256: str
+    path: str | None = None
+
+
+class FileReport(BaseModel):
+    index: int
+    filename: str | None = None
+    size: int | None = None
+    sha256: str | None = None
+    content_type: str | None = None
+    duplicate: bool | None = None
+    error: str | None = None
+
+
+class UploadError(Exception):
+    pass
+
+
+# (signature, offset, content type) of the formats we get the most
+MAGIC_NUMBERS = [
+    (b"\x89PNG\r\n\x1a\n", 0, "image/png"),
+    (b"\xff\xd8\xff", 0, "image/jpeg"),
+    (b"GIF87a", 0, "image/gif"),
+    (b"GIF89a", 0, "image/gif"),
+    (b"WEBP", 8, "image/webp"),
+    (b"%PDF-", 0, "application/pdf"),
+    (b"PK\x03\x04", 0, "application/zip"),
+    (b"\x1f\x8b", 0, "application/gzip"),
+]
+SNIFF_SIZE = 512
+
+
+def sniff_content_type(head: bytes, declared: str | None = None) -> str:
+    for signature, offset, content_type in MAGIC_NUMBERS:
+        if head[offset:offset + len(signature)] == signature:
+            return content_type
+    return declared or "application/octet-stream"
+
+
+def check_upload_size(size: int):
+    if settings.MAX_UPLOAD_FILE_SIZE is not None and size > settings.MAX_UPLOAD_FILE_SIZE:
+        raise UploadError(f"File larger than {settings.MAX_UPLOAD_FILE_SIZE} bytes")
+
+
+# Hashing and file I/O release the GIL, so a thread pool processes the files of a request in parallel.
+# It is shared by all requests, which bounds the concurrency of the whole worker
+upload_executor = ThreadPoolExecutor(max_workers=settings.UPLOAD_WORKERS, thread_name_prefix="upload")
+
+
+async def process_files(
+        func: Callable[[Any], FileReport], items: Sequence[Any], filenames: Sequence[str | None]
+) -> list[FileReport]:
+    """
+    Run func on every item in upload_executor, concurrently. Reports come back in the order of
+    the items, and a failure is reported in the report of its own file without affecting the others.
+    """
+    loop = asyncio.get_running_loop()
+    results = await asyncio.gather(
+        *[loop.run_in_executor(upload_executor, func, item) for item in items],
+        return_exceptions=True,
+    )
+    reports = []
+    for index, (filename, result) in enumerate(zip(filenames, results)):
+        if isinstance(result, (UploadError, OSError)):
+            reports.append(FileReport(index=index, filename=filename, error=str(result)))
+        elif isinstance(result, BaseException):
+            raise result
+        else:
+            reports.append(result.model_copy(update={"index": index, "filename": filename}))
+    return reports
+
+
+def process_bytes(data: bytes) -> FileReport:
+    check_upload_size(len(data))
+    return FileReport(
+        index=0,
+        size=len(data),
+        sha256=hashlib.sha256(data).hexdigest(),
+        content_type=sniff_content_type(data[:SNIFF_SIZE]),
+    )
+
+
+class UploadSink:
+    """
+    Receives the bytes of one uploaded file as they arrive, so nothing is held in memory.
+    This base sink only measures them (size and SHA-256) and drops the data.
+    """
+
+    def __init__(self, field_name: str, filename: str | None = None, content_type: str | None = None):
+        self.field_name = field_name
+        self.filename = filename
+        self.content_type = content_type
+        self.size = 0
+        self._hash = hashlib.sha256()
+
+    async def write(self, data: bytes):
+        self.size += len(data)
+        self._hash.update(data)
+
+    async def close(self):
+        pass
+
+    async def abort(self):
+        pass
+
+    def result(self) -> StreamedFile:
+        return StreamedFile(
+            field_name=self.field_name,
+            filename=self.filename,
+            content_type=self.content_type,
+            size=self.size,
+            sha256=self._hash.hexdigest(),
+        )
+
+
+class SpoolSink(UploadSink):
+    """Measures the file and spools it to a temporary file on disk, which the caller then owns"""
+
+    def __init__(self, field_name: str, filename: str | None = None, content_type: str | None = None,
+                 directory: str | None = None):
+        super().__init__(field_name, filename, content_type)
+        self._file = tempfile.NamedTemporaryFile(dir=directory, prefix="upload-", delete=False)
+        self.path = self._file.name
+
+    async def write(self, data: bytes):
+        await super().write(data)
+        await run_in_threadpool(self._file.write, data)
+
+    async def close(self):
+        await run_in_threadpool(self._file.close)
+
+    async def abort(self):
+        self._file.close()
+        os.remove(self.path)
+
+    def result(self) -> StreamedFile:
+        return super().result().model_copy(update={"path": self.path})
+
+
+SinkFactory = Callable[[str, str | None, str | None], UploadSink]
+
+
+def get_upload_sink_factory() -> SinkFactory:
+    # Dependency, so the sink can be swapped with app.dependency_overrides
+    return UploadSink
+
+
+class StreamingMultipartParser:
+    """
+    Parses a multipart/form-data body straight from the request stream: form fields are kept
+    (they are small), while the data of each file goes to its own sink chunk by chunk.
+    """
+
+    def __init__(self, request: Request, sink_factory: SinkFactory, max_fields: int = 1000,
+                 max_field_size: int = 1024 * 1024):
+        self.request = request
+        self.sink_factory = sink_factory
+        self.max_fields = max_fields
+        self.max_field_size = max_field_size
+        self.fields: list[tuple[str, str]] = []
+        self.sinks: list[UploadSink] = []
+        self._headers: dict[bytes, bytes] = {}
+        self._header_name = b""
+        self._header_value = b""
+        self._field_name = ""
+        self._field_data = bytearray()
+        self._sink: UploadSink | None = None
+        self._pending: list[tuple[UploadSink, bytes | None]] = []     # None closes the sink
+
+    def on_part_begin(self):
+        self._headers = {}
+        self._field_data = bytearray()
+        self._sink = None
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._header_name += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        self._headers[self._header_name.lower()] = self._header_value
+        self._header_name = b""
+        self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if b"name" not in options:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Multipart part without a name")
+        self._field_name = options[b"name"].decode()
+        if b"filename" in options:
+            content_type = self._headers.get(b"content-type")
+            self._sink = self.sink_factory(
+                self._field_name,
+                options[b"filename"].decode(),
+                content_type.decode() if content_type else None,
+            )
+            self.sinks.append(self._sink)
+        elif len(self.fields) >= self.max_fields:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Too many form fields")
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if self._sink is not None:
+            self._pending.append((self._sink, data[start:end]))
+        else:
+            self._field_data += data[start:end]
+            if len(self._field_data) > self.max_field_size:
+                raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Form field too large")
+
+    def on_part_end(self):
+        if self._sink is not None:
+            self._pending.append((self._sink, None))
+        else:
+            self.fields.append((self._field_name, self._field_data.decode()))
+
+    async def parse(self) -> tuple[list[tuple[str, str]], list[StreamedFile]]:
+        content_type, params = parse_options_header(self.request.headers.get("content-type", ""))
+        if content_type != b"multipart/form-data" or b"boundary" not in params:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Expected a multipart/form-data body")
+        parser = MultipartParser(params[b"boundary"], {
+            "on_part_begin": self.on_part_begin,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+        })
+        try:
+            async for chunk in self.request.stream():
+                parser.write(chunk)
+                # The parser callbacks are sync, the sinks are async: flush what each chunk produced
+                for sink, data in self._pending:
+                    if data is None:
+                        await sink.close()
+                    else:
+                        await sink.write(data)
+                self._pending.clear()
+            parser.finalize()
+        except BaseException as e:
+            for sink in self.sinks:
+                await sink.abort()
+            if isinstance(e, FormParserError):
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid multipart data")
+            raise
+        return self.fields, [sink.result() for sink in self.sinks]
+
+
+async def stream_multipart(
+        request: Request, sink_factory: SinkFactory
+) -> tuple[list[tuple[str, str]], list[StreamedFile]]:
+    return await StreamingMultipartParser(request, sink_factory).parse()
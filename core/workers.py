@@ -0,0 +1,84 @@
+import asyncio
+import os
+import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable
+
+from pydantic import BaseModel
+
+
+class PoolSaturated(Exception):
+    pass
+
+
+def lower_thread_priority(nice: int):
+    """Make the calling thread nicer. Linux only: elsewhere setpriority() would renice the whole process"""
+    if nice and sys.platform.startswith("linux"):
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), nice)
+
+
+class PoolStats(BaseModel):
+    max_workers: int
+    max_queue: int
+    in_flight: int
+    completed: int
+    failed: int
+    cancelled: int
+    rejected: int
+
+
+class BoundedPool:
+    """
+    Thread pool for CPU-heavy calls that must not run on the event loop (e.g. password hashing).
+    At most max_workers calls run at once and max_queue more can wait; past that, run() sheds
+    the load by raising PoolSaturated right away instead of letting the queue grow. The threads
+    run with the given nice value, so on a busy CPU the event loop goes first.
+
+    A call stays in flight until its thread is done with it, even if the caller was cancelled
+    meanwhile (only a call still queued can be cancelled). The counters are only touched from
+    the event loop, so they need no lock.
+    """
+
+    def __init__(self, max_workers: int, max_queue: int, name: str = "pool", nice: int = 0):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix=name, initializer=lower_thread_priority, initargs=(nice,)
+        )
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.rejected = 0
+
+    async def run(self, func: Callable, *args: Any, **kwargs: Any) -> Any:
+        if self.in_flight >= self.max_workers + self.max_queue:
+            self.rejected += 1
+            raise PoolSaturated()
+        loop = asyncio.get_running_loop()
+        future = self.executor.submit(partial(func, *args, **kwargs))
+        self.in_flight += 1
+        future.add_done_callback(lambda done: loop.call_soon_threadsafe(self._finished, done))
+        return await asyncio.wrap_future(future)
+
+    def _finished(self, future: Future):
+        self.in_flight -= 1
+        if future.cancelled():
+            self.cancelled += 1
+        elif future.exception() is not None:
+            self.failed += 1
+        else:
+            self.completed += 1
+
+    def stats(self) -> PoolStats:
+        return PoolStats(
+            max_workers=self.max_workers,
+            max_queue=self.max_queue,
+            in_flight=self.in_flight,
+            completed=self.completed,
+            failed=self.failed,
+            cancelled=self.cancelled,
+            rejected=self.rejected,
+        )
@@ -1,13 +1,19 @@
 from fastapi import FastAPI, Request, Response, status
 from fastapi.encoders import jsonable_encoder
-from fastapi.responses import JSONResponse, RedirectResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, RedirectResponse
 from fastapi.exceptions import RequestValidationError
-from fastapi.middleware.cors import CORSMiddleware
+from fastapi.datastructures import Default
 from core import config
-import time as t
 from core.db import create_db_and_tables
+from core.db_profiling import query_profiler
+from core.metrics import http_metrics, registry
+from core.middleware import FastCORSMiddleware, ProcessTimeMiddleware, QueryProfilingMiddleware, RequestProfilingMiddleware
+from core.profiling import PROFILING_SCOPE, profiler
+from core.responses import FastJSONResponse
+from core.routing import FastJSONRoute
+from core.security import api_key_registry, create_default_api_keys
 from core.utils import CommonsDep, MyCustomException
-from routers import files, heroes, items, models, offers, users, credentials
+from routers import admin, files, heroes, heroes_async, items, models, offers, users, credentials
 
 """
     ----------------------------------------------------------------
@@ -19,13 +25,22 @@ from routers import files, heroes, items, models, offers, users, credentials
 app = FastAPI(
     title=config.settings.PROJECT_NAME,
     version=config.settings.PROJECT_VERSION,
+    debug=config.settings.DEBUG,
+    # A default, not a route's own response class: routes with a response model keep being
+    # serialized straight to bytes by pydantic, this one renders the rest
+    default_response_class=Default(FastJSONResponse if config.settings.FAST_JSON_RESPONSES else JSONResponse),
     # dependencies=[Depends(verify_token), Depends(verify_key)] # Dependency to all endpoints
 )
 
+app.router.route_class = FastJSONRoute
+
 
 @app.on_event("startup")
 def on_startup():
     create_db_and_tables()
+    users.create_default_users()
+    users.revocation_list.sync()
+    create_default_api_keys()
 
 
 origins = [
@@ -36,12 +51,22 @@ origins = [
 ]
 
 app.add_middleware(
-    CORSMiddleware,
+    FastCORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if config.settings.DB_PROFILING:
+    app.add_middleware(QueryProfilingMiddleware, profiler=query_profiler, add_headers=config.settings.DEBUG)
+app.add_middleware(
+    RequestProfilingMiddleware,
+    profiler=profiler,
+    api_keys=api_key_registry,
+    scopes=frozenset({PROFILING_SCOPE}),
+)
+# Added last, so it is the outermost: the time and the metrics include the CORS middleware
+app.add_middleware(ProcessTimeMiddleware, metrics=http_metrics)
 
 
 @app.exception_handler(MyCustomException)
@@ -61,13 +86,9 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
     )
 
 
-@app.middleware("http")
-async def add_process_time_header(request: Request, call_next):
-    start_time = t.perf_counter()
-    response = await call_next(request)
-    process_time = t.perf_counter() - start_time
-    response.headers["X-Process-Time"] = str(process_time)
-    return response
+@app.get("/metrics", include_in_schema=False)
+def read_metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 
 app.include_router(credentials.router)
@@ -77,6 +98,8 @@ app.include_router(files.router)
 app.include_router(offers.router)
 app.include_router(models.router)
 app.include_router(heroes.router)
+app.include_router(heroes_async.router)
+app.include_router(admin.router)
 
 
 @app.get("/")
@@ -0,0 +1,37 @@
+import asyncio
+from typing import Annotated
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import PlainTextResponse
+
+from core.config import settings
+from core.profiling import PROFILING_SCOPE, profiler
+from core.security import RequireScopes
+
+
+router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(RequireScopes(PROFILING_SCOPE))])
+
+
+@router.get("/profile", response_class=PlainTextResponse)
+async def profile_worker(
+        seconds: Annotated[float, Query(gt=0, le=settings.PROFILE_MAX_SECONDS)] = 10,
+        idle: bool = False
+):
+    """
+    Sample the stacks of this worker for some seconds, as collapsed stacks for flamegraph.pl or
+    speedscope. With several workers, the one that got the request is profiled.
+    """
+    session = profiler.start(seconds)
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.stop(session)
+    return session.collapsed(idle)
+
+
+@router.get("/profiles/{profile_id}", response_class=PlainTextResponse)
+def read_profile(profile_id: int, idle: bool = False):
+    """The profile of a request sent with an X-Profile header, by the X-Profile-Id of its response"""
+    session = profiler.get(profile_id)
+    if session is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
+    return session.collapsed(idle)
@@ -1,34 +1,50 @@
+import uuid
 from typing import Annotated
-from fastapi import Depends, APIRouter, Form, HTTPException, status
-from passlib.context import CryptContext
+from fastapi import Depends, APIRouter, Form, HTTPException, Response, status
 from datetime import datetime, timedelta, timezone
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm
-import jwt
+from jwt.exceptions import InvalidTokenError
+from pydantic import BaseModel
 
-from core.security import ALGORITHM, SECRET_KEY, Token, FormData
-from routers.users import get_user, fake_users_db
+from core.jwt_keys import key_set
+from core.api_keys import ApiKey
+from core.config import settings
+from core.ratelimit import MemoryRateLimitBackend, RateLimiter, RateLimitStats
+from core.routing import FastJSONRoute
+from core.security import (
+    Token, FormData, RequireScopes, api_key_registry, decode_token, encode_token, password_pool, verify_and_update_password
+)
+from core.workers import PoolSaturated, PoolStats
+from routers.users import get_user, revocation_list, token_cache, user_store
 
 
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+class ApiKeyIn(BaseModel):
+    name: str
+    scopes: list[str] = []
 
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+class ApiKeyOut(BaseModel):
+    id: int
+    name: str
+    prefix: str
+    scopes: list[str]
+    key: str | None = None  # Only when it is created, it can't be retrieved later
 
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
-
-
-def authenticate_user(fake_db, username: str, password: str):
-    user = get_user(fake_db, username)
+def authenticate_user(db, username: str, password: str):
+    user = get_user(db, username)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    verified, new_hash = verify_and_update_password(password, user.hashed_password)
+    if not verified:
         return False
+    if new_hash:
+        # Rehash on login: the only moment we have the plain password to migrate it
+        db.update_password(username, new_hash)
     return user
 
 
@@ -38,37 +54,137 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
         expire = datetime.now(timezone.utc) + expires_delta
     else:
         expire = datetime.now(timezone.utc) + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    # Every token gets its own id, so it can be revoked before it expires
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex})
+    encoded_jwt = encode_token(to_encode)
     return encoded_jwt
 
 
-router = APIRouter(tags=["credentials"])
+def create_refresh_token(username: str):
+    return create_access_token(
+        data={"sub": username, "type": "refresh"},
+        expires_delta=timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS),
+    )
+
+
+def create_tokens(username: str) -> Token:
+    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token = create_access_token(
+        data={"sub": username}, expires_delta=access_token_expires
+    )
+    return Token(access_token=access_token, token_type="bearer", refresh_token=create_refresh_token(username))
+
+
+# Each /token attempt costs a full password verification: refuse brute force before that
+login_rate_limiter = RateLimiter(
+    MemoryRateLimitBackend(max_keys=settings.RATE_LIMIT_MAX_KEYS),
+    name="login",
+    per_ip=settings.LOGIN_RATE_LIMIT_PER_IP,
+    per_username=settings.LOGIN_RATE_LIMIT_PER_USERNAME,
+)
+
+router = APIRouter(tags=["credentials"], route_class=FastJSONRoute)
 
 
-@router.post("/token")
+@router.post("/token", dependencies=[Depends(login_rate_limiter)])
 async def login_for_access_token(
     form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
 ) -> Token:
-    user = authenticate_user(fake_users_db, form_data.username, form_data.password)
+    try:
+        user = await password_pool.run(authenticate_user, user_store, form_data.username, form_data.password)
+    except PoolSaturated:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many logins in progress, try again later",
+            headers={"Retry-After": "1"},
+        )
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+    return create_tokens(user.username)
+
+
+@router.post("/token/refresh")
+async def refresh_access_token(refresh_token: Annotated[str, Form()]) -> Token:
+    """New access and refresh tokens for a valid refresh token, without verifying the password again"""
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
     )
-    return Token(access_token=access_token, token_type="bearer")
+    try:
+        payload = decode_token(refresh_token)
+    except InvalidTokenError:
+        raise credentials_exception
+    if payload.get("type") != "refresh" or "jti" not in payload:
+        raise credentials_exception
+    user = await run_in_threadpool(get_user, user_store, payload.get("sub"))
+    if user is None or user.disabled:
+        raise credentials_exception
+    # Refresh tokens are single use: a stolen one stops working as soon as either party uses it.
+    # Revoking it is the check, so of two concurrent refreshes only the one whose row went in wins.
+    if not await run_in_threadpool(revocation_list.revoke, payload["jti"], payload["exp"]):
+        raise credentials_exception
+    return create_tokens(user.username)
+
+
+@router.post("/token/revoke", status_code=status.HTTP_204_NO_CONTENT)
+async def revoke_token(token: Annotated[str, Form()]):
+    """Revoke an access or a refresh token. Like RFC 7009, an invalid token is not an error"""
+    try:
+        payload = decode_token(token)
+    except InvalidTokenError:
+        return
+    if "jti" in payload and "exp" in payload:
+        await run_in_threadpool(revocation_list.revoke, payload["jti"], payload["exp"])
+    token_cache.invalidate(token)
+
+
+@router.get("/.well-known/jwks.json")
+def read_jwks(response: Response):
+    # Verifiers may cache it for a while: a new key signs nothing before they can see it
+    # only if this max-age is shorter than the time between rotations
+    response.headers["Cache-Control"] = "public, max-age=300"
+    return key_set.jwks() if key_set else {"keys": []}
+
+
+@router.get("/login/rate-limit/stats")
+def read_login_rate_limit_stats() -> RateLimitStats:
+    return login_rate_limiter.stats()
+
+
+@router.get("/login/password-pool/stats")
+def read_password_pool_stats() -> PoolStats:
+    return password_pool.stats()
+
+
+@router.post("/api-keys/", status_code=status.HTTP_201_CREATED)
+def create_api_key(api_key: ApiKeyIn, caller: Annotated[ApiKey, Depends(RequireScopes("api-keys"))]) -> ApiKeyOut:
+    # A key can only hand out the scopes it has itself, or "api-keys" would grant them all
+    if not set(api_key.scopes) <= caller.scopes:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"This key can't grant the scopes {' '.join(sorted(set(api_key.scopes) - caller.scopes))}",
+        )
+    key, record = api_key_registry.add(api_key.name, api_key.scopes)
+    return ApiKeyOut(id=record.id, name=record.name, prefix=record.prefix, scopes=record.scopes.split(), key=key)
+
+
+@router.delete("/api-keys/{key_id}", status_code=status.HTTP_204_NO_CONTENT,
+               dependencies=[Depends(RequireScopes("api-keys"))])
+def revoke_api_key(key_id: int):
+    if not api_key_registry.revoke(key_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="API key not found")
 
 
-@router.post("/login/")
+@router.post("/login/", dependencies=[Depends(login_rate_limiter)])
 async def login(username: Annotated[str, Form()], password: Annotated[str, Form()]):
     return username
 
 
-@router.post("/login2/")
+@router.post("/login2/", dependencies=[Depends(login_rate_limiter)])
 async def login_form(data: Annotated[FormData, Form()]):
     return data
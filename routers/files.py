@@ -1,7 +1,13 @@
+from pathlib import Path
 from typing import Annotated
-from fastapi import APIRouter, File, Form, UploadFile
+from fastapi import APIRouter, Depends, File, Form, Header, HTTPException, Request, UploadFile, status
 from pydantic import BaseModel, HttpUrl
 
+from core.config import settings
+from core.responses import RangeFileResponse
+from core.routing import FastJSONRoute
+from core.storage import SHA256_PATTERN, ContentStore, get_content_store
+from core.uploads import SinkFactory, get_upload_sink_factory, process_bytes, process_files, stream_multipart
 from core.utils import Tags
 
 
@@ -10,12 +16,33 @@ class Image(BaseModel):
     name: str
 
 
-router = APIRouter(tags=[Tags.files])
+router = APIRouter(tags=[Tags.files], route_class=FastJSONRoute)
 
 
-@router.get("/files/{file_path:path}")
+def multipart_openapi(field: str, multiple: bool = False) -> dict:
+    # The streaming routes read the body themselves, so their form is described by hand
+    schema = {"type": "string", "format": "binary"}
+    if multiple:
+        schema = {"type": "array", "items": schema}
+    return {"requestBody": {"content": {"multipart/form-data": {"schema": {
+        "type": "object",
+        "properties": {field: schema},
+    }}}}}
+
+
+@router.head("/files/{file_path:path}", response_class=RangeFileResponse, include_in_schema=False)
+@router.get(
+        "/files/{file_path:path}",
+        summary="Download a file",
+        description="Serves a file under the files root, with support for Range requests",
+        response_class=RangeFileResponse
+    )
 async def read_file(file_path: str):
-    return {"filePath": file_path}
+    root = Path(settings.FILES_ROOT).resolve()
+    path = (root / file_path).resolve()
+    if not path.is_relative_to(root) or not path.is_file():     # No escaping the root with ../
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
+    return RangeFileResponse(path)
 
 
 @router.post("/files/images/multiple/")
@@ -35,25 +62,95 @@ async def create_file(file: Annotated[bytes | None, File(description="A file rea
 
 @router.post("/files/")
 async def create_files(files: Annotated[list[bytes] | None, File()] = None):
-    return {"file_sizes": [len(file) for file in files]}
+    files = files or []
+    reports = await process_files(process_bytes, files, [None] * len(files))
+    return {"file_sizes": [len(file) for file in files], "files": reports}
+
+
+@router.post(
+        "/file/stream/",
+        summary="Upload a file as a stream",
+        description="Reads the upload chunk by chunk, with constant memory, computing its size and SHA-256",
+        openapi_extra=multipart_openapi("file")
+    )
+async def create_file_streaming(request: Request, sink_factory: Annotated[SinkFactory, Depends(get_upload_sink_factory)]):
+    _, files = await stream_multipart(request, sink_factory)
+    file = next((file for file in files if file.field_name == "file"), None)
+    if not file:
+        return {"message": "No upload file sent"}
+    else:
+        return {"file_size": file.size, "sha256": file.sha256}
+
+
+@router.post(
+        "/files/stream/",
+        summary="Upload files as a stream",
+        description="Reads the uploads chunk by chunk, with constant memory, computing their sizes and SHA-256",
+        openapi_extra=multipart_openapi("files", multiple=True)
+    )
+async def create_files_streaming(request: Request, sink_factory: Annotated[SinkFactory, Depends(get_upload_sink_factory)]):
+    _, files = await stream_multipart(request, sink_factory)
+    files = [file for file in files if file.field_name == "files"]
+    return {"file_sizes": [file.size for file in files], "sha256": [file.sha256 for file in files]}
 
 
 @router.post(
         "/uploadfile/",
         summary="Upload a file",
-        description="Upload a single file"
+        description="Upload a single file to the content-addressed store. "
+                    "Send its SHA-256 in X-Content-SHA256 to skip the upload when it is already stored",
+        openapi_extra=multipart_openapi("file")
     )
-async def create_upload_file(file: Annotated[UploadFile, File(description="A file read as UploadFile")]):
-    return {"filename": file.filename}
+async def create_upload_file(
+    request: Request,
+    store: Annotated[ContentStore, Depends(get_content_store)],
+    x_content_sha256: Annotated[str | None, Header()] = None
+):
+    digest = x_content_sha256.lower() if x_content_sha256 else None
+    if digest and SHA256_PATTERN.match(digest) and store.exists(digest):
+        # Already stored: answer without reading the body at all
+        return {"filename": None, "sha256": digest, "size": store.path(digest).stat().st_size, "duplicate": True}
+    _, files = await stream_multipart(request, store.sink)
+    file = next((file for file in files if file.field_name == "file"), None)
+    store.discard([other for other in files if other is not file])
+    if not file:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No upload file sent")
+    report, = await process_files(store.store, [file], [file.filename])
+    if report.error:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=report.error)
+    return report.model_dump(include={"filename", "sha256", "size", "content_type", "duplicate"})
 
 
 @router.post(
         "/uploadfiles/",
         summary="Upload files",
-        description="Upload a list of files"
+        description="Upload a list of files to the content-addressed store",
+        openapi_extra=multipart_openapi("files", multiple=True)
+    )
+async def create_upload_files(request: Request, store: Annotated[ContentStore, Depends(get_content_store)]):
+    _, files = await stream_multipart(request, store.sink)
+    store.discard([file for file in files if file.field_name != "files"])
+    files = [file for file in files if file.field_name == "files"]
+    reports = await process_files(store.store, files, [file.filename for file in files])
+    return {"filename": [file.filename for file in files], "files": reports}
+
+
+@router.head("/uploadfiles/{sha256}", response_class=RangeFileResponse, include_in_schema=False)
+@router.get(
+        "/uploadfiles/{sha256}",
+        summary="Download an uploaded file",
+        description="Serves a file of the content-addressed store by its SHA-256",
+        response_class=RangeFileResponse
+    )
+async def read_upload_file(sha256: str, store: Annotated[ContentStore, Depends(get_content_store)]):
+    if not SHA256_PATTERN.match(sha256) or not store.exists(sha256):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
+    # The content never changes for a given hash, so it can be cached forever
+    return RangeFileResponse(
+        store.path(sha256),
+        media_type="application/octet-stream",
+        headers={"ETag": f'"{sha256}"', "Cache-Control": "public, max-age=31536000, immutable"},
     )
-async def create_upload_files(files: Annotated[list[UploadFile], File(description="A file read as UploadFile")]):
-    return {"filename": [file.filename for file in files]}
 
 
 @router.post(
@@ -62,12 +159,12 @@ async def create_upload_files(files: Annotated[list[UploadFile], File(descriptio
         description="Allows to upload files and add some form"
     )
 async def create_files_and_forms(
-    file_a: Annotated[bytes, File()],
+    file_a: Annotated[UploadFile, File()],     # UploadFile spools big files to disk instead of holding them in memory
     file_b: Annotated[UploadFile, File()],
     token: Annotated[str, Form()]
 ):
     return {
-        "file_a_size": len(file_a),
+        "file_a_size": file_a.size,
         "token": token,
         "file_b_content_type": file_b.content_type
     }
@@ -1,13 +1,145 @@
-import select
-from typing import Annotated
-from fastapi import APIRouter, HTTPException, Query, status
+import json
+from typing import Annotated, Any, Literal
+from fastapi import APIRouter, HTTPException, Query, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, ValidationError
+from sqlalchemy.exc import SQLAlchemyError
+from sqlmodel import Session, insert, or_, select
 
+from core.cache import Cache, CacheStats, LRUCache
+from core.config import settings
 from core.db import SessionDep
+from core.pagination import Page, decode_cursor, encode_cursor
+from core.routing import ETagRoute
 from core.utils import Tags
 from routers.models import Hero
 
 
-router = APIRouter(tags=[Tags.heroes])
+class HeroBulkError(BaseModel):
+    index: int
+    detail: Any
+
+
+class HeroBulkResult(BaseModel):
+    ids: list[int | None] = []
+    errors: list[HeroBulkError] = []
+
+
+router = APIRouter(tags=[Tags.heroes], route_class=ETagRoute)
+
+# Heroes are read far more than they are written, so single-hero lookups go through this cache.
+# Swap it for a RedisCache (or any Cache) to share it between workers
+hero_cache: Cache = LRUCache(max_bytes=settings.HERO_CACHE_MAX_BYTES, ttl=settings.HERO_CACHE_TTL)
+
+
+def hero_cache_key(hero_id: int) -> str:
+    return f"hero:{hero_id}"
+
+
+def cached_hero_response(hero_id: int) -> Response | None:
+    cached = hero_cache.get(hero_cache_key(hero_id))
+    if cached is None:
+        return None
+    return Response(content=cached, media_type="application/json")
+
+
+def cache_hero_response(hero: Hero, generation: int) -> Response:
+    """generation is the hero_cache one, taken before the hero was read: see Cache"""
+    content = hero.model_dump_json().encode()
+    hero_cache.set(hero_cache_key(hero.id), content, generation=generation)
+    return Response(content=content, media_type="application/json")
+
+
+def insert_heroes_chunk(session: Session, rows: list[dict]) -> list[int]:
+    # One executemany (batched INSERT ... RETURNING) and one commit for the whole chunk
+    statement = insert(Hero).returning(Hero.id, sort_by_parameter_order=True)
+    try:
+        ids = session.scalars(statement, rows).all()
+        session.commit()
+    except (SQLAlchemyError, OverflowError):
+        session.rollback()
+        raise
+    return list(ids)
+
+
+async def iter_bulk_rows(request: Request):
+    if request.headers.get("content-type", "").startswith("application/x-ndjson"):
+        buffer = b""
+        async for data in request.stream():
+            buffer += data
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                if line.strip():
+                    yield line
+        if buffer.strip():
+            yield buffer
+    else:
+        try:
+            rows = await request.json()
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Body must be a JSON array or NDJSON")
+        if not isinstance(rows, list):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Body must be a JSON array or NDJSON")
+        for row in rows:
+            yield row
+
+
+async def aenumerate(iterable):
+    index = 0
+    async for item in iterable:
+        yield index, item
+        index += 1
+
+
+def validate_bulk_row(row: Any) -> dict:
+    if isinstance(row, bytes):
+        row = json.loads(row)
+    return Hero.model_validate(row).model_dump()
+
+
+async def save_bulk_chunk(session: Session, chunk: dict[int, dict], result: HeroBulkResult):
+    try:
+        ids = await run_in_threadpool(insert_heroes_chunk, session, list(chunk.values()))
+    except (SQLAlchemyError, OverflowError):
+        # Some row broke the chunk (e.g. a duplicated id, or one SQLite can't store, which the
+        # driver raises as a bare OverflowError): retry row by row to find which one
+        ids = []
+        for index, row in chunk.items():
+            try:
+                ids.extend(await run_in_threadpool(insert_heroes_chunk, session, [row]))
+            except (SQLAlchemyError, OverflowError) as e:
+                ids.append(None)
+                result.errors.append(HeroBulkError(index=index, detail=str(getattr(e, "orig", None) or e)))
+    for index, hero_id in zip(chunk, ids):
+        result.ids[index] = hero_id
+    hero_cache.delete(*[hero_cache_key(hero_id) for hero_id in ids if hero_id is not None])
+
+
+def heroes_keyset_statement(cursor: str, order_by: str, limit: int):
+    # Keyset mode: seek straight to the last seen row through the index, so every page costs the same
+    statement = select(Hero)
+    if order_by == "name":
+        statement = statement.order_by(Hero.name, Hero.id)
+        if cursor:
+            last_name, last_id = decode_cursor(cursor, order_by)
+            # name >= ? first, on its own: SQLite only seeks the index on a plain bound, not on an OR
+            statement = statement.where(
+                Hero.name >= last_name, or_(Hero.name > last_name, Hero.id > last_id)
+            )
+    else:
+        statement = statement.order_by(Hero.id)
+        if cursor:
+            _, last_id = decode_cursor(cursor, order_by)
+            statement = statement.where(Hero.id > last_id)
+    return statement.limit(limit)
+
+
+def heroes_page(heroes: list[Hero], order_by: str, limit: int) -> Page[Hero]:
+    next_cursor = None
+    if len(heroes) == limit:
+        last = heroes[-1]
+        next_cursor = encode_cursor(order_by, getattr(last, order_by), last.id)
+    return Page[Hero](data=heroes, next_cursor=next_cursor)
 
 
 @router.post("/heroes/")
@@ -15,21 +147,81 @@ def create_hero(hero: Hero, session: SessionDep) -> Hero:
     session.add(hero)
     session.commit()
     session.refresh(hero)
+    session.close()     # See read_heroes
+    hero_cache.delete(hero_cache_key(hero.id))
     return hero
 
 
-@router.get("/heroes/")
-def read_heroes(session: SessionDep, offset: int = 0, limit: Annotated[int, Query(le=100)] = 100) -> list[Hero]:
-    heroes = session.exec(select(Hero).offset(offset).limit(limit)).all()
-    return heroes
+@router.post("/heroes/bulk", openapi_extra={"requestBody": {"content": {
+    "application/json": {"schema": {"type": "array", "items": Hero.model_json_schema()}},
+    "application/x-ndjson": {"schema": {"type": "string"}},
+}}})
+async def create_heroes_bulk(
+    request: Request,
+    session: SessionDep,
+    chunk_size: Annotated[int, Query(gt=0, le=10000)] = settings.HEROES_BULK_CHUNK_SIZE,
+) -> HeroBulkResult:
+    """
+    Insert many heroes from a JSON array or an NDJSON stream (`Content-Type: application/x-ndjson`).
+
+    Rows are validated and inserted in chunks, each chunk in a single transaction.
+    Invalid rows are reported in **errors** by their position and don't abort the batch;
+    **ids** follows the input order and is `null` for the rows that were not inserted.
+    """
+    result = HeroBulkResult()
+    chunk: dict[int, dict] = {}     # input index -> validated row
+    async for index, row in aenumerate(iter_bulk_rows(request)):
+        result.ids.append(None)
+        try:
+            chunk[index] = validate_bulk_row(row)
+        except ValidationError as e:
+            result.errors.append(HeroBulkError(index=index, detail=e.errors(include_url=False, include_context=False)))
+        except ValueError:
+            result.errors.append(HeroBulkError(index=index, detail="Invalid JSON"))
+        if len(chunk) >= chunk_size:
+            await save_bulk_chunk(session, chunk, result)
+            chunk = {}
+    if chunk:
+        await save_bulk_chunk(session, chunk, result)
+
+    result.errors.sort(key=lambda error: error.index)
+    return result
+
 
+@router.get("/heroes/", response_model=list[Hero] | Page[Hero])
+def read_heroes(
+    session: SessionDep,
+    offset: int = 0,
+    limit: Annotated[int, Query(ge=1, le=100)] = 100,
+    cursor: Annotated[str | None, Query(description="Send an empty cursor to start keyset pagination")] = None,
+    order_by: Literal["id", "name"] = "id",
+):
+    if cursor is None:
+        # Offset mode, kept for backwards compatibility (gets slower the deeper the page)
+        heroes = session.exec(select(Hero).offset(offset).limit(limit)).all()
+    else:
+        heroes = session.exec(heroes_keyset_statement(cursor, order_by, limit)).all()
+    # FastAPI validates what a sync route returns in the threadpool: hand the connection back
+    # first, or the requests waiting there for a thread hold the connections the threads wait for
+    session.close()
+    return heroes if cursor is None else heroes_page(heroes, order_by, limit)
 
-@router.get("/heroes/{hero_id}")
-def read_hero(hero_id: int, session: SessionDep) -> Hero:
+
+@router.get("/heroes/cache/stats")
+def read_hero_cache_stats() -> CacheStats:
+    return hero_cache.stats()
+
+
+@router.get("/heroes/{hero_id}", response_model=Hero)
+def read_hero(hero_id: int, session: SessionDep):
+    response = cached_hero_response(hero_id)
+    if response:
+        return response
+    generation = hero_cache.generation(hero_cache_key(hero_id))
     hero = session.get(Hero, hero_id)
     if not hero:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Hero not found")
-    return hero
+    return cache_hero_response(hero, generation)
 
 
 @router.delete("/heroes/{hero_id}")
@@ -39,4 +231,5 @@ def delete_hero(hero_id: int, session: SessionDep):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Hero not found")
     session.delete(hero)
     session.commit()
+    hero_cache.delete(hero_cache_key(hero_id))
     return {"ok": True}
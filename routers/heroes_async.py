@@ -0,0 +1,63 @@
+from typing import Annotated, Literal
+from fastapi import APIRouter, HTTPException, Query, status
+from sqlmodel import select
+
+from core.db import AsyncSessionDep
+from core.pagination import Page
+from core.routing import ETagRoute
+from core.utils import Tags
+from routers.heroes import (
+    cache_hero_response, cached_hero_response, hero_cache, hero_cache_key, heroes_keyset_statement, heroes_page
+)
+from routers.models import Hero
+
+
+# Same CRUD as routers/heroes.py, but on the async engine: the handlers run on the event loop
+# instead of taking a slot of the threadpool for every database call
+router = APIRouter(prefix="/async", tags=[Tags.heroes], route_class=ETagRoute)
+
+
+@router.post("/heroes/")
+async def create_hero(hero: Hero, session: AsyncSessionDep) -> Hero:
+    session.add(hero)
+    await session.commit()
+    await session.refresh(hero)
+    hero_cache.delete(hero_cache_key(hero.id))
+    return hero
+
+
+@router.get("/heroes/", response_model=list[Hero] | Page[Hero])
+async def read_heroes(
+    session: AsyncSessionDep,
+    offset: int = 0,
+    limit: Annotated[int, Query(ge=1, le=100)] = 100,
+    cursor: Annotated[str | None, Query(description="Send an empty cursor to start keyset pagination")] = None,
+    order_by: Literal["id", "name"] = "id",
+):
+    if cursor is None:
+        return (await session.exec(select(Hero).offset(offset).limit(limit))).all()
+    heroes = (await session.exec(heroes_keyset_statement(cursor, order_by, limit))).all()
+    return heroes_page(heroes, order_by, limit)
+
+
+@router.get("/heroes/{hero_id}", response_model=Hero)
+async def read_hero(hero_id: int, session: AsyncSessionDep):
+    response = cached_hero_response(hero_id)
+    if response:
+        return response
+    generation = hero_cache.generation(hero_cache_key(hero_id))
+    hero = await session.get(Hero, hero_id)
+    if not hero:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Hero not found")
+    return cache_hero_response(hero, generation)
+
+
+@router.delete("/heroes/{hero_id}")
+async def delete_hero(hero_id: int, session: AsyncSessionDep):
+    hero = await session.get(Hero, hero_id)
+    if not hero:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Hero not found")
+    await session.delete(hero)
+    await session.commit()
+    hero_cache.delete(hero_cache_key(hero_id))
+    return {"ok": True}
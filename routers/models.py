@@ -1,8 +1,10 @@
+import time
 from enum import Enum
 from typing import Annotated
 from fastapi import APIRouter, Query
 from sqlmodel import SQLModel, Field as FieldSQL
 
+from core.routing import FastJSONRoute
 from core.utils import FilterParams, Tags
 
 
@@ -19,7 +21,38 @@ class Hero(SQLModel, table=True):
     secret_name: str
 
 
-router = APIRouter(tags=[Tags.models])
+class UserRecord(SQLModel, table=True):
+    __tablename__ = "user"
+
+    id: int | None = FieldSQL(default=None, primary_key=True)
+    username: str = FieldSQL(unique=True, index=True)
+    email: str = FieldSQL(unique=True, index=True)
+    full_name: str | None = None
+    disabled: bool = False
+    hashed_password: str
+
+
+class RevokedToken(SQLModel, table=True):
+    __tablename__ = "revoked_token"
+
+    id: int | None = FieldSQL(default=None, primary_key=True)
+    jti: str = FieldSQL(unique=True)
+    expires_at: float = FieldSQL(index=True)
+
+
+class ApiKeyRecord(SQLModel, table=True):
+    __tablename__ = "api_key"
+
+    id: int | None = FieldSQL(default=None, primary_key=True)
+    prefix: str = FieldSQL(index=True)
+    key_hash: str
+    name: str
+    scopes: str = ""    # Space separated, like OAuth2 scopes
+    revoked: bool = False
+    created_at: float = FieldSQL(default_factory=time.time)
+
+
+router = APIRouter(tags=[Tags.models], route_class=FastJSONRoute)
 
 
 @router.get("/models/{model_name}")
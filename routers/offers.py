@@ -2,6 +2,7 @@ from fastapi import APIRouter
 from pydantic import BaseModel
 
 from routers.items import Item
+from core.routing import FastJSONRoute
 from core.utils import Tags
 
 
@@ -12,7 +13,7 @@ class Offer(BaseModel):
     items: list[Item]
 
 
-router = APIRouter(tags=[Tags.offers])
+router = APIRouter(tags=[Tags.offers], route_class=FastJSONRoute)
 
 
 @router.post("/offers/")
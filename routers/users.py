@@ -1,11 +1,25 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
 from typing import Annotated
 from fastapi import APIRouter, Depends, HTTPException, status
-from pydantic import BaseModel, EmailStr
-import jwt
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, EmailStr, Field
+from sqlalchemy import Engine
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, delete, insert, select, update
 from jwt.exceptions import InvalidTokenError
 
+from core.config import settings
+from core.db import engine
+from core.routing import FastJSONRoute
 from core.utils import CommonsDep, InternalError, Tags
-from core.security import ALGORITHM, SECRET_KEY, TokenData, fake_password_hasher, oauth2_scheme
+from core.security import (
+    TokenData, VerifiedTokenCache, decode_token, get_password_hash, oauth2_scheme, password_pool
+)
+from core.workers import PoolSaturated
+from routers.models import RevokedToken, UserRecord
 
 
 class BaseUser(BaseModel):
@@ -20,27 +34,216 @@ class UserIn(BaseUser):
 
 
 class UserDb(BaseUser):
+    model_config = {"frozen": True}     # Instances are cached and shared between requests
+
     hashed_password: str
 
 
+class UserStore:
+    """
+    Users saved in the database, looked up by the unique index on username. Found users are
+    kept in an LRU of frozen UserDb for ttl seconds, so a repeated lookup is a dict access,
+    nobody can change a cached user by accident, and a worker learns of a user changed by
+    another one within ttl.
+    """
+
+    def __init__(self, engine: Engine, max_entries: int, ttl: float):
+        self.engine = engine
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._cache: OrderedDict[str, tuple[UserDb, float]] = OrderedDict()    # username -> (user, expires_at)
+        self._lock = threading.Lock()
+
+    def cached(self, username: str) -> tuple[UserDb, float] | None:
+        """The cached user and the time.time() until which it may be used, without querying"""
+        with self._lock:
+            entry = self._cache.get(username)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                del self._cache[username]
+                return None
+            self._cache.move_to_end(username)
+            return entry
+
+    def load(self, username: str) -> tuple[UserDb | None, float]:
+        """Like cached(), querying the database on a miss: call it off the event loop"""
+        entry = self.cached(username)
+        if entry is not None:
+            return entry
+        with Session(self.engine) as session:
+            record = session.exec(select(UserRecord).where(UserRecord.username == username)).first()
+        expires_at = time.time() + self.ttl
+        if record is None:
+            return None, expires_at
+        user = UserDb.model_validate(record, from_attributes=True)
+        with self._lock:
+            self._cache[username] = (user, expires_at)
+            self._cache.move_to_end(username)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return user, expires_at
+
+    def get(self, username: str) -> UserDb | None:
+        return self.load(username)[0]
+
+    def add(self, users: list[UserDb]):
+        """Insert all users in one transaction (raises IntegrityError on a taken username or email)"""
+        rows = [{**user.model_dump(), "disabled": bool(user.disabled)} for user in users]
+        with Session(self.engine) as session:
+            session.execute(insert(UserRecord), rows)
+            session.commit()
+
+    def add_missing(self, users: list[UserDb]):
+        with Session(self.engine) as session:
+            usernames = [user.username for user in users]
+            existing = set(session.exec(select(UserRecord.username).where(UserRecord.username.in_(usernames))))
+        missing = [user for user in users if user.username not in existing]
+        if missing:
+            self.add(missing)
+
+    def set_disabled(self, username: str, disabled: bool):
+        with Session(self.engine) as session:
+            session.execute(update(UserRecord).where(UserRecord.username == username).values(disabled=disabled))
+            session.commit()
+        self.invalidate(username)
+
+    def update_password(self, username: str, hashed_password: str):
+        with Session(self.engine) as session:
+            session.execute(
+                update(UserRecord).where(UserRecord.username == username).values(hashed_password=hashed_password)
+            )
+            session.commit()
+        self.invalidate(username)
+
+    def invalidate(self, username: str):
+        with self._lock:
+            self._cache.pop(username, None)
+        invalidate_user_tokens(username)
+
+
+user_store = UserStore(engine, max_entries=settings.USER_CACHE_MAX_ENTRIES, ttl=settings.USER_CACHE_TTL)
+
+
 def get_user(db, username: str):
     try:
-        if username in db:
-            user_dict = db[username]
-            return UserDb(**user_dict)
+        return db.get(username)
     except InternalError:
         print("We don't swallow the internal error here, we raise again 😎")
         raise
 
 
-def fake_save_user(user_in: UserIn):
-    hashed_password = fake_password_hasher(user_in.password)
-    user_in_db = UserDb(**user_in.model_dump(),                 # **user_in.model_dump() is an unwrap - it will pass
-                                                                # all attributes as key: value, avoiding refactoring
-                                                                # when some change occurs in the base class
-                        hashed_password=hashed_password)        # Changing a key explicitly
-    print("User saved! ..not really")
-    return user_in_db
+def current_username(username: str) -> str | None:
+    """Dependency: the username if it is a user's, else None. Sync, so the lookup runs in the threadpool"""
+    user = get_user(user_store, username)
+    return user.username if user else None
+
+
+async def save_users(users_in: list[UserIn]) -> list[UserDb]:
+    try:
+        # Each hash runs on its own worker of the password pool, so a batch is hashed in parallel
+        hashed_passwords = await asyncio.gather(
+            *[password_pool.run(get_password_hash, user_in.password) for user_in in users_in]
+        )
+    except PoolSaturated:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many signups in progress, try again later",
+            headers={"Retry-After": "1"},
+        )
+    users = [
+        UserDb(**user_in.model_dump(exclude={"password"}), hashed_password=hashed_password)
+        for user_in, hashed_password in zip(users_in, hashed_passwords)
+    ]
+    try:
+        await run_in_threadpool(user_store.add, users)
+    except IntegrityError:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Username or email already registered")
+    return users
+
+
+# Clients reuse their bearer token for many calls: skip the JWT decode and the user lookup for the next ones
+token_cache = VerifiedTokenCache(
+    max_entries=settings.TOKEN_CACHE_MAX_ENTRIES,
+    max_ttl=settings.TOKEN_CACHE_MAX_TTL
+)
+
+
+def invalidate_user_tokens(username: str):
+    """Call it when a user is disabled or changed, so its cached tokens are verified again"""
+    token_cache.invalidate_user(username)
+
+
+class RevocationList:
+    """
+    jti of the revoked tokens that haven't expired yet. They are saved in the database, so all
+    the workers share them, and mirrored in a dict, so checking a token is a lookup, not a query.
+    At most every sync_interval, a thread of its own makes the dict catch up with the rows added
+    by other workers (the autoincrement id is the high-water mark) and prunes the expired entries
+    from both: a token past its exp fails the JWT check anyway. is_revoked() runs on the event
+    loop and never waits for the database; revoke() writes to it, call it off the loop.
+    """
+
+    def __init__(self, engine: Engine, sync_interval: float):
+        self.engine = engine
+        self.sync_interval = sync_interval
+        self._revoked: dict[str, float] = {}    # jti -> exp
+        self._last_id = 0
+        self._synced_at = float("-inf")
+        self._syncing = False
+        self._lock = threading.Lock()
+
+    def revoke(self, jti: str, expires_at: float) -> bool:
+        """True if this call revoked the token, False if it was already revoked or has expired"""
+        if expires_at <= time.time() or self.is_revoked(jti):
+            return False
+        try:
+            with Session(self.engine) as session:
+                session.add(RevokedToken(jti=jti, expires_at=expires_at))
+                session.commit()
+            revoked = True
+        except IntegrityError:
+            revoked = False     # Another request or worker revoked it first: jti is unique
+        with self._lock:
+            self._revoked[jti] = expires_at
+        return revoked
+
+    def is_revoked(self, jti: str) -> bool:
+        if time.monotonic() - self._synced_at >= self.sync_interval:
+            self.start_sync()
+        expires_at = self._revoked.get(jti)
+        return expires_at is not None and expires_at > time.time()
+
+    def start_sync(self):
+        with self._lock:
+            if self._syncing:
+                return
+            self._syncing = True
+        threading.Thread(target=self.sync, name="revocation-sync", daemon=True).start()
+
+    def sync(self):
+        try:
+            now = time.time()
+            with Session(self.engine) as session:
+                session.execute(delete(RevokedToken).where(RevokedToken.expires_at <= now))
+                session.commit()
+                rows = session.exec(
+                    select(RevokedToken.id, RevokedToken.jti, RevokedToken.expires_at)
+                    .where(RevokedToken.id > self._last_id)
+                ).all()
+            with self._lock:
+                revoked = {jti: exp for jti, exp in self._revoked.items() if exp > now}
+                for row_id, jti, expires_at in rows:
+                    revoked[jti] = expires_at
+                    self._last_id = max(self._last_id, row_id)
+                self._revoked = revoked
+        finally:
+            with self._lock:
+                self._syncing = False
+                self._synced_at = time.monotonic()  # Even if it failed: the next try is an interval later
+
+
+revocation_list = RevocationList(engine, sync_interval=settings.REVOCATION_SYNC_SECONDS)
 
 
 async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
@@ -49,17 +252,34 @@ async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    cached = token_cache.get(token)
+    if cached is not None:
+        user, jti = cached
+        if jti is not None and revocation_list.is_revoked(jti):
+            raise credentials_exception
+        return user
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_token(token)
         username: str = payload.get("sub")
-        if username is None:
+        if username is None or payload.get("type") == "refresh":
             raise credentials_exception
         token_data = TokenData(username=username)
     except InvalidTokenError:
         raise credentials_exception
-    user = get_user(fake_users_db, username=token_data.username)
+    jti = payload.get("jti")
+    if jti is not None and revocation_list.is_revoked(jti):
+        raise credentials_exception
+    entry = user_store.cached(token_data.username)
+    if entry is None:
+        # A query: it must not block the event loop
+        entry = await run_in_threadpool(user_store.load, token_data.username)
+    user, user_expires_at = entry
     if user is None:
         raise credentials_exception
+    if "exp" in payload:
+        # The jti is kept with the user: a token revoked after it was cached must still be rejected.
+        # Nor may the entry outlive the cached user, or a change could take twice the TTL to show up
+        token_cache.set(token, (user, jti), user.username, min(payload["exp"], user_expires_at))
     return user
 
 
@@ -71,30 +291,36 @@ async def get_current_active_user(
     return current_user
 
 
-fake_users_db = {
-    "johndoe": {
-        "username": "johndoe",
-        "full_name": "John Doe",
-        "email": "johndoe@example.com",
-        "hashed_password": "$2b$12$EixZaYVK1fsbw1ZfbX3OXePaWxn96p36WQoeG6Lruj3vjPGga31lW",
-        "disabled": False,
-    },
-    "alice": {
-        "username": "alice",
-        "full_name": "Alice Wonderson",
-        "email": "alice@example.com",
-        "hashed_password": "fakehashedsecret2",
-        "disabled": True,
-    },
-}
+default_users = [
+    UserDb(
+        username="johndoe",
+        full_name="John Doe",
+        email="johndoe@example.com",
+        hashed_password="$2b$12$EixZaYVK1fsbw1ZfbX3OXePaWxn96p36WQoeG6Lruj3vjPGga31lW",
+        disabled=False,
+    ),
+    UserDb(
+        username="alice",
+        full_name="Alice Wonderson",
+        email="alice@example.com",
+        hashed_password="fakehashedsecret2",
+        disabled=True,
+    ),
+]
+
+
+def create_default_users():
+    user_store.add_missing(default_users)
 
 
-router = APIRouter(tags=[Tags.users])
+router = APIRouter(tags=[Tags.users], route_class=FastJSONRoute)
 
 
-@router.post("/user/", response_model=BaseUser)
-async def create_user(user: UserIn):
-    user_saved = fake_save_user(user)
+@router.post("/user/", response_model=BaseUser | list[BaseUser])
+async def create_user(user: UserIn | Annotated[list[UserIn], Field(max_length=settings.SIGNUP_BATCH_MAX_SIZE)]):
+    if isinstance(user, list):
+        return await save_users(user)
+    user_saved, = await save_users([user])
     return user_saved
 
 
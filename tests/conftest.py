@@ -0,0 +1,18 @@
+import tempfile
+
+import pytest
+
+from benchmarks.server import configure
+
+# Before anything imports core.db, which builds the engines: the tests get a database of their own
+configure(tempfile.mkdtemp(prefix="tests-"))
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from main import app  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(app) as client:
+        yield client
@@ -0,0 +1,20 @@
+ADMIN_KEY = {"X-Key": "fake-super-secret-key"}     # Scopes items and api-keys
+
+
+def test_create_api_key_with_own_scopes(client):
+    response = client.post("/api-keys/", json={"name": "reader", "scopes": ["items"]}, headers=ADMIN_KEY)
+    assert response.status_code == 201
+    assert response.json()["scopes"] == ["items"]
+    key = response.json()["key"]
+    assert client.get("/items/token", headers={"X-Key": key, "X-Token": "fake-super-secret-token"}).status_code == 200
+
+
+def test_create_api_key_cannot_escalate_scopes(client):
+    response = client.post("/api-keys/", json={"name": "profiler", "scopes": ["items", "profiling"]}, headers=ADMIN_KEY)
+    assert response.status_code == 403
+    assert "profiling" in response.json()["detail"]
+
+
+def test_create_api_key_needs_api_keys_scope(client):
+    response = client.post("/api-keys/", json={"name": "other", "scopes": []}, headers={"X-Key": "fake-super-secret-token"})
+    assert response.status_code == 403
@@ -0,0 +1,61 @@
+from email.utils import formatdate
+from pathlib import Path
+
+import pytest
+
+from core.config import settings
+
+
+CONTENT = b"0123456789" * 100
+
+
+@pytest.fixture(scope="module")
+def file_url():
+    root = Path(settings.FILES_ROOT)
+    root.mkdir(parents=True, exist_ok=True)
+    (root / "digits.txt").write_bytes(CONTENT)
+    return "/files/digits.txt"
+
+
+def test_read_file(client, file_url):
+    response = client.get(file_url)
+    assert response.status_code == 200
+    assert response.content == CONTENT
+    assert response.headers["etag"]
+
+
+def test_read_file_range(client, file_url):
+    response = client.get(file_url, headers={"Range": "bytes=10-19"})
+    assert response.status_code == 206
+    assert response.content == CONTENT[10:20]
+
+
+@pytest.mark.parametrize("method", ["GET", "HEAD"])
+def test_read_file_if_none_match(client, file_url, method):
+    etag = client.get(file_url).headers["etag"]
+    # Before the Range: a client with the current copy doesn't need any part of it
+    response = client.request(method, file_url, headers={"If-None-Match": etag, "Range": "bytes=0-9"})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+    assert client.get(file_url, headers={"If-None-Match": '"other"'}).status_code == 200
+
+
+def test_read_file_if_modified_since(client, file_url):
+    last_modified = client.get(file_url).headers["last-modified"]
+    assert client.get(file_url, headers={"If-Modified-Since": last_modified}).status_code == 304
+    assert client.get(file_url, headers={"If-Modified-Since": formatdate(0, usegmt=True)}).status_code == 200
+    assert client.get(file_url, headers={"If-Modified-Since": "yesterday"}).status_code == 200
+    # If-None-Match wins over If-Modified-Since
+    response = client.get(file_url, headers={"If-None-Match": '"other"', "If-Modified-Since": last_modified})
+    assert response.status_code == 200
+
+
+def test_read_upload_file_if_none_match(client):
+    response = client.post("/uploadfile/", files={"file": ("digits.txt", CONTENT)})
+    assert response.status_code == 200
+    sha256 = response.json()["sha256"]
+    response = client.get(f"/uploadfiles/{sha256}", headers={"If-None-Match": f'"{sha256}"'})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["cache-control"] == "public, max-age=31536000, immutable"
@@ -0,0 +1,15 @@
+import pytest
+
+from core.utils import InternalError
+
+
+def test_item_username_of_unknown_user(client):
+    response = client.get("/items/plumbus/username", params={"username": "nobody"})
+    assert response.status_code == 200
+    assert response.json() == "plumbus"
+
+
+def test_item_username_of_known_user(client):
+    # Nothing handles InternalError, the test client re-raises it
+    with pytest.raises(InternalError, match="owned by johndoe"):
+        client.get("/items/portal-gun/username", params={"username": "johndoe"})
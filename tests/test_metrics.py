@@ -0,0 +1,14 @@
+import pytest
+
+from core.metrics import Metric
+
+
+def test_metric_needs_samples():
+    with pytest.raises(TypeError, match="samples"):
+        Metric("things_total", "Things")
+
+
+def test_metrics_endpoint(client):
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert "# TYPE http_requests_total counter" in response.text
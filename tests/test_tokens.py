@@ -0,0 +1,27 @@
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from routers.users import revocation_list
+
+
+def test_refresh_token_is_single_use(client):
+    response = client.post("/token", data={"username": "johndoe", "password": "secret"})
+    assert response.status_code == 200
+    refresh_token = response.json()["refresh_token"]
+    first = client.post("/token/refresh", data={"refresh_token": refresh_token})
+    assert first.status_code == 200
+    second = client.post("/token/refresh", data={"refresh_token": refresh_token})
+    assert second.status_code == 401
+    # The new refresh token works, once
+    assert client.post("/token/refresh", data={"refresh_token": first.json()["refresh_token"]}).status_code == 200
+
+
+def test_revoke_once():
+    jti = uuid.uuid4().hex
+    expires_at = time.time() + 60
+    with ThreadPoolExecutor(8) as executor:
+        results = list(executor.map(lambda _: revocation_list.revoke(jti, expires_at), range(8)))
+    assert results.count(True) == 1
+    assert revocation_list.is_revoked(jti)
+    assert not revocation_list.revoke(uuid.uuid4().hex, time.time() - 1)